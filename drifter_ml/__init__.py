@@ -4,6 +4,12 @@ from .classification_tests import classification_tests
 from .columnar_tests import columnar_tests
 from .regression_tests import regression_tests
 from .structural_tests import structural_tests
+from .timeseries_tests import timeseries_tests
+from .execution import ExecutionConfig, get_execution_config, set_execution_config
+from .comparison import ModelComparison
 
 
-__all__ = ["classification_tests", "columnar_tests", "regression_tests", "structural_tests"]
+__all__ = ["classification_tests", "columnar_tests", "regression_tests", "structural_tests",
+           "timeseries_tests",
+           "ExecutionConfig", "get_execution_config", "set_execution_config",
+           "ModelComparison"]
@@ -0,0 +1,138 @@
+import time
+import numpy as np
+
+def _clock_ns():
+    # time.perf_counter_ns is python 3.7+
+    return int(time.perf_counter() * 1e9)
+
+if hasattr(time, "perf_counter_ns"):
+    _clock_ns = time.perf_counter_ns
+
+class BatchLatency():
+    def __init__(self, sample_size, timings_ns):
+        self.sample_size = sample_size
+        self.timings_ns = np.asarray(timings_ns, dtype=np.int64)
+
+    def percentile(self, q):
+        # in seconds, to line up with max_run_time budgets
+        return float(np.percentile(self.timings_ns, q)) / 1e9
+
+    @property
+    def p50(self):
+        return self.percentile(50)
+
+    @property
+    def p95(self):
+        return self.percentile(95)
+
+    @property
+    def p99(self):
+        return self.percentile(99)
+
+    @property
+    def mean(self):
+        return float(np.mean(self.timings_ns)) / 1e9
+
+    @property
+    def throughput(self):
+        # rows per second at the median latency
+        if self.p50 == 0:
+            return float("inf")
+        return self.sample_size / self.p50
+
+    def to_dict(self):
+        return {
+            "sample_size": self.sample_size,
+            "trials": len(self.timings_ns),
+            "mean": self.mean,
+            "p50": self.p50,
+            "p95": self.p95,
+            "p99": self.p99,
+            "throughput": self.throughput,
+        }
+
+class LatencyBenchmark():
+    def __init__(self, predict, data, warmup=1, trials=10, random_state=None):
+        if trials < 1:
+            raise ValueError("trials must be at least 1")
+        self.predict = predict
+        self.data = data
+        self.warmup = warmup
+        self.trials = trials
+        self.random_state = np.random.RandomState(random_state)
+
+    def sample(self, sample_size):
+        if hasattr(self.data, "sample"):
+            return self.data.sample(sample_size, replace=True,
+                                    random_state=self.random_state)
+        indices = self.random_state.randint(0, len(self.data), size=sample_size)
+        return np.take(self.data, indices, axis=0)
+
+    def measure(self, sample_size):
+        # the same batch is reused across trials so that the spread
+        # reflects the model, not the rows that happened to be drawn
+        batch = self.sample(sample_size)
+        for _ in range(self.warmup):
+            self.predict(batch)
+        timings = np.empty(self.trials, dtype=np.int64)
+        for trial in range(self.trials):
+            start_time = _clock_ns()
+            self.predict(batch)
+            timings[trial] = _clock_ns() - start_time
+        return BatchLatency(sample_size, timings)
+
+    def curve(self, sample_sizes):
+        return [self.measure(int(sample_size)) for sample_size in sample_sizes]
+
+def check_budget(latency, performance_info, budget_percentile=50):
+    failures = []
+    budgets = [("max_run_time", latency.percentile(budget_percentile)),
+               ("max_p50", latency.p50),
+               ("max_p95", latency.p95),
+               ("max_p99", latency.p99)]
+    for name, observed in budgets:
+        if name in performance_info and observed > float(performance_info[name]):
+            failures.append((latency.sample_size, name,
+                             observed, float(performance_info[name])))
+    if "min_throughput" in performance_info:
+        minimum = float(performance_info["min_throughput"])
+        if latency.throughput < minimum:
+            failures.append((latency.sample_size, "min_throughput",
+                             latency.throughput, minimum))
+    return failures
+
+class BenchmarkReport():
+    def __init__(self, latencies, failures):
+        self.latencies = latencies
+        self.failures = failures
+
+    @property
+    def passed(self):
+        return not self.failures
+
+    def __bool__(self):
+        return self.passed
+
+    def to_dict(self):
+        return {
+            "passed": self.passed,
+            "latencies": [latency.to_dict() for latency in self.latencies],
+            "failures": [
+                {"sample_size": sample_size, "budget": budget,
+                 "observed": observed, "limit": limit}
+                for sample_size, budget, observed, limit in self.failures
+            ],
+        }
+
+def run_time_stress_test(predict, data, performance_boundary,
+                         warmup=1, trials=10, budget_percentile=50,
+                         random_state=None):
+    benchmark = LatencyBenchmark(predict, data, warmup=warmup,
+                                 trials=trials, random_state=random_state)
+    latencies = []
+    failures = []
+    for performance_info in performance_boundary:
+        latency = benchmark.measure(int(performance_info["sample_size"]))
+        latencies.append(latency)
+        failures.extend(check_budget(latency, performance_info, budget_percentile))
+    return BenchmarkReport(latencies, failures)
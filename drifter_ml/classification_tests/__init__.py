@@ -1,4 +1,8 @@
 from .classification_tests import ClassificationTests
 from .classification_tests import ClassifierComparison
+from .per_class import PerClassMetrics, per_class_metrics, confusion_matrix
+from .per_class import confusion_matrix_metrics, count_metrics
 
-__all__ = ["ClassificationTests", "ClassifierComparison"]
+__all__ = ["ClassificationTests", "ClassifierComparison",
+           "PerClassMetrics", "per_class_metrics", "confusion_matrix",
+           "confusion_matrix_metrics", "count_metrics"]
@@ -3,10 +3,16 @@ import numpy as np
 import time
 from sklearn import neighbors
 from scipy import stats
-from sklearn.model_selection import cross_validate, cross_val_predict
 from functools import partial
 from sklearn.model_selection import KFold
-from sklearn.base import clone
+from ..prediction_cache import PredictionCache
+from .. import data_sources
+from .. import significance
+from ..cross_validation import CrossValidationEngine
+from ..execution import get_execution_config
+from .. import benchmarking
+from .. import robust_statistics
+from .per_class import per_class_metrics
 
 class FixedClassificationMetrics():
     def __init__(self):
@@ -61,14 +67,44 @@ class ClassificationTests(FixedClassificationMetrics):
                  clf,
                  test_data,
                  target_name,
-                 column_names):
+                 column_names,
+                 execution_config=None):
         self.clf = clf
+        test_data = data_sources.as_data(test_data)
         self.test_data = test_data
         self.column_names = column_names
         self.target_name = target_name
         self.y = test_data[target_name]
-        self.X = test_data[column_names]
+        self._X = None
         self.classes = set(self.y)
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self.prediction_cache = PredictionCache(execution_config)
+        self.cross_validation_engine = CrossValidationEngine(clf, test_data, self.y,
+                                                             execution_config,
+                                                             columns=column_names)
+
+    @property
+    def X(self):
+        # selected on first use; cross validation reads the columns
+        # straight from test_data
+        if self._X is None:
+            self._X = self.test_data[self.column_names]
+        return self._X
+
+    def predict(self):
+        return self.prediction_cache.predict(self.clf, self.X)
+
+    def predict_proba(self):
+        return self.prediction_cache.predict_proba(self.clf, self.X)
+
+    def invalidate_predictions(self):
+        self.prediction_cache.invalidate()
+        self.cross_validation_engine.invalidate()
+
+    def per_class_metrics(self):
+        return per_class_metrics(self.y, self.predict())
             
     def get_test_score(self, cross_val_dict):
         return list(cross_val_dict["test_score"])
@@ -77,37 +113,21 @@ class ClassificationTests(FixedClassificationMetrics):
     def precision_cv(self, cv, average='binary'):
         average = self.reset_average(average)
         precision_score = partial(self.precision_score, average=average)
-        precision = metrics.make_scorer(precision_score)
-        result =  cross_validate(self.clf, self.X,
-                                 self.y, cv=cv,
-                                 scoring=(precision))
-        return self.get_test_score(result)
+        return self.cross_validation_engine.scores(cv, precision_score)
     
     def recall_cv(self, cv, average='binary'):
         average = self.reset_average(average)
         recall_score = partial(self.recall_score, average=average)
-        recall = metrics.make_scorer(recall_score)
-        result = cross_validate(self.clf, self.X,
-                                self.y, cv=cv,
-                                scoring=(recall))
-        return self.get_test_score(result)
+        return self.cross_validation_engine.scores(cv, recall_score)
     
     def f1_cv(self, cv, average='binary'):
         average = self.reset_average(average)
         f1_score = partial(self.f1_score, average=average)
-        f1 = metrics.make_scorer(f1_score)
-        result = cross_validate(self.clf, self.X,
-                                self.y, cv=cv,
-                                scoring=(f1))
-        return self.get_test_score(result)
+        return self.cross_validation_engine.scores(cv, f1_score)
 
     def roc_auc_cv(self, cv, average="micro"):
         roc_auc_score = partial(metrics.roc_auc_score, average=average)
-        roc_auc = metrics.make_scorer(roc_auc_score)
-        result = cross_validate(self.clf, self.X,
-                                self.y, cv=cv,
-                                scoring=(roc_auc))
-        return self.get_test_score(result)
+        return self.cross_validation_engine.scores(cv, roc_auc_score)
     
     def _cross_val_avg(self, scores, minimum_center_tolerance):
         avg = np.mean(scores)
@@ -116,25 +136,25 @@ class ClassificationTests(FixedClassificationMetrics):
         return True
 
     def _get_per_class(self, y_true, y_pred, metric):
+        # metric is either the name of a per class metric ("precision",
+        # "recall", "f1"), computed for every class in one pass, or a
+        # callable applied to each class's rows in turn
+        if isinstance(metric, str):
+            measures = per_class_metrics(y_true, y_pred).to_dict(metric)
+            return {klass: measures.get(klass, 0.0) for klass in self.classes}
+        y_true = np.asarray(y_true)
+        y_pred = np.asarray(y_pred)
         class_measures = {klass: None for klass in self.classes}
         for klass in self.classes:
-            y_pred_class = np.take(y_pred, y_true[y_true == klass].index, axis=0)
-            y_class = y_true[y_true == klass]
-            class_measures[klass] = metric(y_class, y_pred_class)
+            in_class = y_true == klass
+            class_measures[klass] = metric(y_true[in_class], y_pred[in_class])
         return class_measures
 
     def _per_class_cross_val(self, metric, cv, random_state=42):
         kfold = KFold(n_splits=cv, shuffle=True, random_state=random_state)
-        clf = clone(self.clf)
         scores = []
-        for train, test in kfold.split(self.test_data):
-            train_data = self.test_data.loc[train]
-            test_data = self.test_data.loc[test]
-            clf.fit(train_data[self.column_names], train_data[self.target_name])
-            y_pred = clf.predict(test_data[self.column_names])
-            y_true = test_data[self.target_name]
-            y_true.index = list(range(len(y_true)))
-            scores.append(self._get_per_class(y_true, y_pred, metric))
+        for fold in self.cross_validation_engine.fold_results(kfold):
+            scores.append(self._get_per_class(fold.y_true, fold.y_pred, metric))
         return scores
 
     def _cross_val_anomaly_detection(self, scores, tolerance):
@@ -168,6 +188,12 @@ class ClassificationTests(FixedClassificationMetrics):
         return True
 
     def _per_class(self, y_pred, metric, lower_boundary):
+        if isinstance(metric, str):
+            measures = per_class_metrics(self.y, y_pred).to_dict(metric)
+            for klass in self.classes:
+                if measures.get(klass, 0.0) < lower_boundary[klass]:
+                    return False
+            return True
         for klass in self.classes:
             y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
             y_class = self.y[self.y == klass]
@@ -192,23 +218,17 @@ class ClassificationTests(FixedClassificationMetrics):
 
     def cross_val_per_class_precision_anomaly_detection(self, tolerance,
                                                         cv=3, average='binary'):
-        average = self.reset_average(average)
-        precision_score = partial(self.precision_score, average=average)
-        return self._cross_val_per_class_anomaly_detection(precision_score,
+        return self._cross_val_per_class_anomaly_detection("precision",
                                                            tolerance, cv)
 
     def cross_val_per_class_recall_anomaly_detection(self, tolerance,
                                                      cv=3, average='binary'):
-        average = self.reset_average(average)
-        recall_score = partial(self.recall_score, average=average)
-        return self._cross_val_per_class_anomaly_detection(recall_score,
+        return self._cross_val_per_class_anomaly_detection("recall",
                                                            tolerance, cv)
 
     def cross_val_per_class_f1_anomaly_detection(self, tolerance,
                                                  cv=3, average='binary'):
-        average = self.reset_average(average)
-        f1_score = partial(self.f1_score, average=average)
-        return self._cross_val_per_class_anomaly_detection(f1_score,
+        return self._cross_val_per_class_anomaly_detection("f1",
                                                            tolerance, cv)
 
     def cross_val_per_class_roc_auc_anomaly_detection(self, tolerance,
@@ -256,7 +276,7 @@ class ClassificationTests(FixedClassificationMetrics):
     def cross_val_roc_auc_avg(self, minimum_center_tolerance, cv=3, average='micro'):
         self.roc_auc_exception()
         scores = self.roc_auc_cv(cv, average=average)
-        return self._cross_val_avg(score, minimum_center_tolerance)
+        return self._cross_val_avg(scores, minimum_center_tolerance)
     
     def cross_val_precision_lower_boundary(self, lower_boundary, cv=3, average='binary'):
         average = self.reset_average(average)
@@ -275,7 +295,7 @@ class ClassificationTests(FixedClassificationMetrics):
 
     def cross_val_roc_auc_lower_boundary(self, lower_boundary, cv=3, average='micro'):
         self.roc_auc_exception()
-        scores = self.roc_auc(cv, average=average)
+        scores = self.roc_auc_cv(cv, average=average)
         return self._cross_val_lower_boundary(scores, lower_boundary)
     
     def cross_val_classifier_testing(self,
@@ -296,15 +316,10 @@ class ClassificationTests(FixedClassificationMetrics):
             return False
 
     def trimean(self, data):
-        q1 = np.quantile(data, 0.25)
-        q3 = np.quantile(data, 0.75)
-        median = np.median(data)
-        return (q1 + 2*median + q3)/4
+        return robust_statistics.trimean(data)
 
     def trimean_absolute_deviation(self, data):
-        trimean = self.trimean(data)
-        numerator = [abs(elem - trimean) for elem in data]
-        return sum(numerator)/len(data)
+        return robust_statistics.trimean_absolute_deviation(data)
         
     def describe_scores(self, scores, method):
         if method == "mean":
@@ -359,27 +374,21 @@ class ClassificationTests(FixedClassificationMetrics):
     # algorithm could be stored in metadata
     # Todo: determine if still relevant ^
     def precision_lower_boundary_per_class(self, lower_boundary: dict, average='binary'):
-        average = self.reset_average(average)
-        precision_score = partial(self.precision_score, average=average)
-        y_pred = self.clf.predict(self.X)
-        return self._per_class(y_pred, self.precision_score, lower_boundary)
+        y_pred = self.predict()
+        return self._per_class(y_pred, "precision", lower_boundary)
 
     def recall_lower_boundary_per_class(self, lower_boundary: dict, average='binary'):
-        average = self.reset_average(average)
-        recall_score = partial(self.recall_score, average=average)
-        y_pred = self.clf.predict(self.X)
-        return self._per_class(y_pred, recall_score, lower_boundary)
+        y_pred = self.predict()
+        return self._per_class(y_pred, "recall", lower_boundary)
     
     def f1_lower_boundary_per_class(self, lower_boundary: dict, average='binary'):
-        average = self.reset_average(average)
-        f1_score = partial(self.f1_score, average=average)
-        y_pred = self.clf.predict(self.X)
-        return self._per_class(y_pred, f1_score, lower_boundary)
+        y_pred = self.predict()
+        return self._per_class(y_pred, "f1", lower_boundary)
 
     def roc_auc_lower_boundary_per_class(self, lower_boundary: dict, average='micro'):
         self.roc_auc_exception()
-        roc_auc_score = partial(self.roc_auc_score, average=average)
-        y_pred = self.clf.predict(self.X)
+        roc_auc_score = partial(metrics.roc_auc_score, average=average)
+        y_pred = self.predict()
         return self._per_class(y_pred, roc_auc_score, lower_boundary)
 
     def classifier_testing(self,
@@ -395,17 +404,19 @@ class ClassificationTests(FixedClassificationMetrics):
         else:
             return False
 
-    def run_time_stress_test(self, performance_boundary: dict):
-        for performance_info in performance_boundary:
-            n = int(performance_info["sample_size"])
-            max_run_time = float(performance_info["max_run_time"])
-            data = self.X.sample(n, replace=True)
-            start_time = time.time()
-            self.clf.predict(data)
-            model_run_time = time.time() - start_time
-            if model_run_time > max_run_time:
-                return False
-        return True
+    def run_time_stress_test(self, performance_boundary,
+                             warmup=1, trials=10, budget_percentile=50,
+                             random_state=None):
+        # budgets (max_run_time, max_p50, max_p95, max_p99, min_throughput)
+        # are checked against repeated timings per sample size; the
+        # report is truthy when every budget holds
+        return benchmarking.run_time_stress_test(self.clf.predict,
+                                                 self.X,
+                                                 performance_boundary,
+                                                 warmup=warmup,
+                                                 trials=trials,
+                                                 budget_percentile=budget_percentile,
+                                                 random_state=random_state)
 
 class ClassifierComparison(FixedClassificationMetrics):
     def __init__(self,
@@ -413,15 +424,67 @@ class ClassifierComparison(FixedClassificationMetrics):
                  clf_two,
                  test_data,
                  target_name,
-                 column_names):
+                 column_names,
+                 execution_config=None):
         self.clf_one = clf_one
         self.clf_two = clf_two
         self.column_names = column_names
         self.target_name = target_name
+        test_data = data_sources.as_data(test_data)
         self.test_data = test_data
         self.y = test_data[target_name]
-        self.X = test_data[column_names]
+        self._X = None
         self.classes = set(self.y)
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self.prediction_cache = PredictionCache(execution_config)
+        self.cross_validation_engines = {}
+
+    @property
+    def X(self):
+        if self._X is None:
+            self._X = self.test_data[self.column_names]
+        return self._X
+
+    def predict(self, clf):
+        return self.prediction_cache.predict(clf, self.X)
+
+    def predict_proba(self, clf):
+        return self.prediction_cache.predict_proba(clf, self.X)
+
+    def invalidate_predictions(self, clf=None):
+        self.prediction_cache.invalidate(model=clf)
+        if clf is None:
+            self.cross_validation_engines = {}
+        else:
+            self.cross_validation_engines.pop(id(clf), None)
+
+    def per_class_metrics(self, clf):
+        return per_class_metrics(self.y, self.predict(clf))
+
+    def cross_validation_engine(self, clf):
+        if id(clf) not in self.cross_validation_engines:
+            self.cross_validation_engines[id(clf)] = CrossValidationEngine(
+                clf, self.test_data, self.y, self.execution_config,
+                columns=self.column_names)
+        return self.cross_validation_engines[id(clf)]
+
+    def _cross_val_predict(self, clf, cv):
+        # out of fold predictions are stitched together from the engine's
+        # folds, which are fit once per (model, splitter), so every
+        # cross_val_* method shares the same cv fits of a model
+        folds = self.cross_validation_engine(clf).fold_results(cv)
+        test_index = np.concatenate([fold.test_index for fold in folds])
+        if len(test_index) != len(self.y) or len(np.unique(test_index)) != len(self.y):
+            raise ValueError("cross_val_predict only works for partitions")
+        fold_predictions = np.concatenate([fold.y_pred for fold in folds])
+        y_pred = np.empty_like(fold_predictions)
+        y_pred[test_index] = fold_predictions
+        return y_pred
+
+    def _restrict_to_classes(self, measures):
+        return {klass: measures.get(klass, 0.0) for klass in self.classes}
 
     def is_binary(self):
         num_classes = len(set(self.classes))
@@ -454,48 +517,27 @@ class ClassifierComparison(FixedClassificationMetrics):
         return True
     
     def precision_per_class(self, clf, average="binary"):
-        average = self.reset_average(average)
-        precision_score = partial(self.precision_score, average=average)
-        y_pred = clf.predict(self.X)
-        precision = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            precision[klass] = precision_score(y_class, y_pred_class) 
-        return precision
+        measures = self.per_class_metrics(clf).to_dict("precision")
+        return self._restrict_to_classes(measures)
 
     def recall_per_class(self, clf, average="binary"):
-        average = self.reset_average(average)
-        recall_score = partial(self.recall_score, average=average)
-        y_pred = clf.predict(self.X)
-        recall = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            recall[klass] = recall_score(y_class, y_pred_class)
-        return recall
+        measures = self.per_class_metrics(clf).to_dict("recall")
+        return self._restrict_to_classes(measures)
 
     def f1_per_class(self, clf, average="binary"):
-        average = self.reset_average(average)
-        f1_score = partial(self.f1_score, average=average)
-        y_pred = clf.predict(self.X)
-        f1 = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            f1[klass] = f1_score(y_class, y_pred_class)
-        return f1
+        measures = self.per_class_metrics(clf).to_dict("f1")
+        return self._restrict_to_classes(measures)
 
     def roc_auc_per_class(self, clf, average="micro"):
         self.roc_auc_exception()
         roc_auc_score = partial(metrics.roc_auc_score, average=average)
-        y_pred = clf.predict(self.X)
+        y_pred = self.predict(clf)
         roc_auc = {}
         for klass in self.classes:
             y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
             y_class = self.y[self.y == klass]
             roc_auc[klass] = roc_auc_score(y_class, y_pred_class)
-        return ruc_auc
+        return roc_auc
 
     def _precision_recall_f1_result(self,
                                     precision_one_test,
@@ -559,43 +601,43 @@ class ClassifierComparison(FixedClassificationMetrics):
                                              f1_one_test,
                                              f1_two_test)
         
+    def paired_bootstrap(self, n_resamples=2000, alpha=0.05, seed=None):
+        return significance.paired_bootstrap_classification(self.y,
+                                                            self.predict(self.clf_one),
+                                                            self.predict(self.clf_two),
+                                                            n_resamples=n_resamples,
+                                                            alpha=alpha,
+                                                            seed=seed)
+
+    def significant_two_model_classifier_testing(self, alpha=0.05,
+                                                 n_resamples=2000, seed=None):
+        # model one only fails when it is significantly worse than model
+        # two, i.e. the whole interval of one - two is below zero
+        results = self.paired_bootstrap(n_resamples, alpha, seed)
+        for metric in ["precision", "recall", "f1"]:
+            if results[metric]["confidence_interval"][1] < 0:
+                return False
+        return True
+
     def cross_val_precision_per_class(self, clf, cv=3, average="binary"):
-        average = self.reset_average(average)
-        precision_score = partial(self.precision_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
-        precision = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            precision[klass] = precision_score(y_class, y_pred_class) 
-        return precision
+        y_pred = self._cross_val_predict(clf, cv)
+        measures = per_class_metrics(self.y, y_pred).to_dict("precision")
+        return self._restrict_to_classes(measures)
 
     def cross_val_recall_per_class(self, clf, cv=3, average="binary"):
-        average = self.reset_average(average)
-        recall_score = partial(self.recall_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
-        recall = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            recall[klass] = recall_score(y_class, y_pred_class)
-        return recall
+        y_pred = self._cross_val_predict(clf, cv)
+        measures = per_class_metrics(self.y, y_pred).to_dict("recall")
+        return self._restrict_to_classes(measures)
 
     def cross_val_f1_per_class(self, clf, cv=3, average="binary"):
-        average = self.reset_average(average)
-        f1_score = partial(self.f1_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
-        f1 = {}
-        for klass in self.classes:
-            y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
-            y_class = self.y[self.y == klass]
-            f1[klass] = f1_score(y_class, y_pred_class)
-        return f1
+        y_pred = self._cross_val_predict(clf, cv)
+        measures = per_class_metrics(self.y, y_pred).to_dict("f1")
+        return self._restrict_to_classes(measures)
 
     def cross_val_roc_auc_per_class(self, clf, cv=3, average="micro"):
         self.roc_auc_exception()
         roc_auc_score = partial(metrics.roc_auc_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
+        y_pred = self._cross_val_predict(clf, cv)
         roc_auc = {}
         for klass in self.classes:
             y_pred_class = np.take(y_pred, self.y[self.y == klass].index, axis=0)
@@ -641,25 +683,25 @@ class ClassifierComparison(FixedClassificationMetrics):
     def cross_val_precision(self, clf, cv=3, average="binary"):
         average = self.reset_average(average)
         precision_score = partial(self.precision_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
+        y_pred = self._cross_val_predict(clf, cv)
         return precision_score(self.y, y_pred) 
 
     def cross_val_recall(self, clf, cv=3, average="binary"):
         average = self.reset_average(average)
         recall_score = partial(self.recall_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
+        y_pred = self._cross_val_predict(clf, cv)
         return recall_score(self.y, y_pred)
 
     def cross_val_f1(self, clf, cv=3, average="binary"):
         average = self.reset_average(average)
         f1_score = partial(self.f1_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
+        y_pred = self._cross_val_predict(clf, cv)
         return f1_score(self.y, y_pred)
 
     def cross_val_roc_auc(self, clf, cv=3, average="micro"):
         self.roc_auc_exception()
         roc_auc_score = partial(metrics.roc_auc_score, average=average)
-        y_pred = cross_val_predict(clf, self.X, self.y, cv=cv)
+        y_pred = self._cross_val_predict(clf, cv)
         return roc_auc_score(self.y, y_pred)
 
     def cross_val_two_model_classifier_testing(self, cv=3, average="binary"):
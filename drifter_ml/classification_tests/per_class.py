@@ -0,0 +1,77 @@
+import numpy as np
+
+def encode_labels(y_true, y_pred, labels=None):
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    if labels is None:
+        labels, codes = np.unique(np.concatenate([y_true, y_pred]),
+                                  return_inverse=True)
+        codes = codes.reshape(-1)
+        return labels, codes[:len(y_true)], codes[len(y_true):]
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind="mergesort")
+    sorted_labels = labels[order]
+    codes = []
+    for y in (y_true, y_pred):
+        position = np.searchsorted(sorted_labels, y)
+        position = np.clip(position, 0, len(labels) - 1)
+        if not (sorted_labels[position] == y).all():
+            raise ValueError("y contains labels that are not in labels")
+        codes.append(order[position])
+    return labels, codes[0], codes[1]
+
+def confusion_matrix(y_true, y_pred, labels=None):
+    labels, true_codes, pred_codes = encode_labels(y_true, y_pred, labels)
+    n_labels = len(labels)
+    counts = np.bincount(true_codes * n_labels + pred_codes,
+                         minlength=n_labels * n_labels)
+    return labels, counts.reshape(n_labels, n_labels)
+
+def _safe_divide(numerator, denominator):
+    result = np.zeros(np.broadcast(numerator, denominator).shape, dtype=float)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+def confusion_matrix_metrics(matrices):
+    # accuracy and macro precision, recall and f1 for a stack of
+    # confusion matrices shaped (..., labels, labels).  Macro averages run
+    # over the labels each matrix saw or predicted, as average="macro" does
+    matrices = np.asarray(matrices)
+    return count_metrics(np.diagonal(matrices, axis1=-2, axis2=-1),
+                         matrices.sum(axis=-1), matrices.sum(axis=-2))
+
+def count_metrics(true_positives, support, predicted):
+    # the same metrics from per label true positive, support and predicted
+    # counts shaped (..., labels)
+    precision = _safe_divide(true_positives, predicted)
+    recall = _safe_divide(true_positives, support)
+    f1 = _safe_divide(2 * true_positives, support + predicted)
+    present = (support + predicted) > 0
+    n_present = present.sum(axis=-1)
+    return {
+        "accuracy": true_positives.sum(axis=-1) / support.sum(axis=-1),
+        "precision": (precision * present).sum(axis=-1) / n_present,
+        "recall": (recall * present).sum(axis=-1) / n_present,
+        "f1": (f1 * present).sum(axis=-1) / n_present,
+    }
+
+# Per class (one-vs-rest) precision, recall and f1 for every label,
+# all derived from a single confusion matrix.
+class PerClassMetrics():
+    def __init__(self, labels, matrix):
+        self.labels = labels
+        self.matrix = matrix
+        true_positives = np.diag(matrix).astype(float)
+        self.support = matrix.sum(axis=1)
+        self.predicted = matrix.sum(axis=0)
+        self.precision = _safe_divide(true_positives, self.predicted)
+        self.recall = _safe_divide(true_positives, self.support)
+        self.f1 = _safe_divide(2 * true_positives, self.support + self.predicted)
+
+    def to_dict(self, metric):
+        values = getattr(self, metric)
+        return dict(zip(self.labels.tolist(), values.tolist()))
+
+def per_class_metrics(y_true, y_pred, labels=None):
+    labels, matrix = confusion_matrix(y_true, y_pred, labels)
+    return PerClassMetrics(labels, matrix)
@@ -1,4 +1,10 @@
 from .columnar_tests import DataSanitization
 from .columnar_tests import ColumnarData
+from .historical_profile import HistoricalProfile, ColumnProfile
+from .sanitization_profile import SanitizationProfile
+from .streaming import StreamingColumnarData, RunningMoments, QuantileSketch, StreamingHistogram
+from .hyperloglog import HyperLogLog
 
-__all__ = ["DataSanitization", "ColumnarData"]
+__all__ = ["DataSanitization", "ColumnarData", "HistoricalProfile", "ColumnProfile",
+           "SanitizationProfile", "StreamingColumnarData", "RunningMoments", "QuantileSketch",
+           "StreamingHistogram", "HyperLogLog"]
@@ -2,42 +2,82 @@ from sklearn import metrics
 import numpy as np
 import time
 from scipy import stats
-from mlxtend.evaluate import permutation_test
+from .permutation import permutation_test
+from .. import robust_statistics
+from .historical_profile import HistoricalProfile
+from .sanitization_profile import SanitizationProfile
+from .. import data_sources
+
+class DataSanitization():
+    def __init__(self, data, profile=None, approximate=False, precision=14):
+        self.data = data_sources.as_data(data)
+        self._profile = profile
+        self.approximate = approximate
+        self.precision = precision
+
+    @property
+    def profile(self):
+        # built on first use, every predicate below reads from it
+        if self._profile is None:
+            self._profile = SanitizationProfile(self.data, approximate=self.approximate,
+                                                precision=self.precision)
+        return self._profile
+
+    def invalidate_profile(self):
+        self._profile = None
 
-class DataSanitization(): 
-    def __init__(self, data):
-        self.data = data
-        
     def is_complete(self, column):
-        return self.data[column].isnull().sum() == 0
+        return bool(self.profile.get(column, "nulls") == 0)
 
     def has_completeness(self, column, threshold):
-        return self.data[column].isnull().sum()/len(self.data) > threshold
+        return bool(1 - self.profile.get(column, "nulls")/len(self.data) > threshold)
 
-    def is_unique(self, column):
-        return len(self.data[column].unique())/len(self.data) == 1
+    def is_unique(self, column, confidence=0.95):
+        if self.profile.approximate:
+            # unique up to the sketch's error: True when full uniqueness is
+            # within the error bounds, so duplicates fewer than the relative
+            # error go unseen.  uniqueness_bounds gives the interval itself
+            return bool(self.profile.distinct_bounds(column, confidence)[1] >= len(self.data))
+        return bool(self.profile.get(column, "distinct")/len(self.data) == 1)
 
     def has_uniqueness(self, column, threshold):
-        return len(self.data[column].unique())/len(self.data) > threshold
+        return bool(self.profile.get(column, "distinct")/len(self.data) > threshold)
+
+    def uniqueness_bounds(self, column, threshold, confidence=0.95):
+        # the uniqueness estimate with its error bounds, and whether the
+        # threshold check holds across the whole interval
+        n_rows = float(len(self.data))
+        lower, upper = self.profile.distinct_bounds(column, confidence)
+        uniqueness = self.profile.get(column, "distinct")/n_rows
+        return {
+            "uniqueness": uniqueness,
+            "lower": lower/n_rows,
+            "upper": upper/n_rows,
+            "passed": bool(uniqueness > threshold),
+            "certain": bool(lower/n_rows > threshold or upper/n_rows <= threshold),
+        }
 
     def is_in_range(self, column, lower_bound, upper_bound, threshold):
-        return self.data[(self.data[column] <= upper_bound) & (self.data[column] >= lower_bound)]/len(self.data) > threshold
+        return bool(self.profile.range_hits(column, lower_bound, upper_bound)/len(self.data) > threshold)
 
     def is_non_negative(self, column):
-        return self.data[self.data[column] > 0]
+        return bool(self.profile.get(column, "negative") == 0)
 
     def is_less_than(self, column_one, column_two):
-        return self.data[self.data[column_one] < self.data[column_two]].all()
+        return bool((self.data[column_one] < self.data[column_two]).all())
 
 class ColumnarData():
-    def __init__(self, historical_data, new_data):
-        self.new_data = new_data
-        self.historical_data = historical_data
+    def __init__(self, historical_data, new_data, historical_profile=None):
+        self.new_data = data_sources.as_data(new_data)
+        self.historical_data = data_sources.as_data(historical_data)
+        if historical_profile is None:
+            historical_profile = HistoricalProfile(self.historical_data)
+        self.historical_profile = historical_profile
 
     def mean_similarity(self, column, tolerance=2):
         new_mean = float(np.mean(self.new_data[column]))
-        old_mean = float(np.mean(self.historical_data[column]))
-        std = float(np.std(self.historical_data[column]))
+        old_mean = self.historical_profile[column].mean
+        std = self.historical_profile[column].std
         upper_bound = old_mean + (std * tolerance)
         lower_bound = old_mean - (std * tolerance)
         if new_mean < lower_bound:
@@ -49,8 +89,8 @@ class ColumnarData():
 
     def median_similarity(self, column, tolerance=2):
         new_median = float(np.median(self.new_data[column]))
-        old_median = float(np.median(self.historical_data[column]))
-        iqr = float(stats.iqr(self.historical_data[column]))
+        old_median = self.historical_profile[column].median
+        iqr = self.historical_profile[column].iqr
         upper_bound = old_median + (iqr * tolerance)
         lower_bound = old_median - (iqr * tolerance)
         if new_median < lower_bound:
@@ -61,20 +101,15 @@ class ColumnarData():
             return True
 
     def trimean(self, data):
-        q1 = float(np.quantile(data, 0.25))
-        q3 = float(np.quantile(data, 0.75))
-        median = float(np.median(data))
-        return (q1 + 2*median + q3)/4
+        return robust_statistics.trimean(data)
 
     def trimean_absolute_deviation(self, data):
-        trimean = self.trimean(data)
-        numerator = [abs(elem - trimean) for elem in data]
-        return sum(numerator)/len(data)
+        return robust_statistics.trimean_absolute_deviation(data)
 
     def trimean_similarity(self, column, tolerance=2):
         new_trimean = self.trimean(self.new_data[column])
-        old_trimean = self.trimean(self.historical_data[column])
-        tad = self.trimean_absolute_deviation(self.historical_data[column])
+        old_trimean = self.historical_profile[column].trimean
+        tad = self.historical_profile[column].trimean_absolute_deviation
         upper_bound = old_trimean + (tad * tolerance)
         lower_bound = old_trimean - (tad * tolerance)
         if new_trimean < lower_bound:
@@ -94,15 +129,16 @@ class ColumnarData():
     def pearson_similar_correlation(self, column,
                                      correlation_lower_bound,
                                      pvalue_threshold=0.05,
-                                     num_rounds=3):
+                                     num_rounds=3,
+                                     method="approximate"):
         correlation_info = stats.pearsonr(self.new_data[column],
                                           self.historical_data[column])
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "pearson",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.pearsonr(x, y)[0],
             seed=0)
         if p_value > pvalue_threshold:
             return False
@@ -113,15 +149,16 @@ class ColumnarData():
     def spearman_similar_correlation(self, column,
                                       correlation_lower_bound,
                                       pvalue_threshold=0.05,
-                                      num_rounds=3):
+                                      num_rounds=3,
+                                      method="approximate"):
         correlation_info = stats.spearmanr(self.new_data[column],
                                            self.historical_data[column])
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "spearman",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.spearmanr(x, y).correlation,
             seed=0)
         if p_value > pvalue_threshold:
             return False
@@ -131,13 +168,14 @@ class ColumnarData():
 
     def wilcoxon_similar_distribution(self, column,
                                        pvalue_threshold=0.05,
-                                       num_rounds=3):
+                                       num_rounds=3,
+                                       method="approximate"):
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "wilcoxon",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.wilcoxon(x, y).statistic,
             seed=0)
         if p_value < pvalue_threshold:
             return False
@@ -145,13 +183,14 @@ class ColumnarData():
         
     def ks_2samp_similar_distribution(self, column,
                                        pvalue_threshold=0.05,
-                                       num_rounds=3):
+                                       num_rounds=3,
+                                       method="approximate"):
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "ks_2samp",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.ks_2samp(x, y).statistic,
             seed=0)
         if p_value < pvalue_threshold:
             return False
@@ -159,13 +198,14 @@ class ColumnarData():
 
     def kruskal_similar_distribution(self, column,
                                       pvalue_threshold=0.05,
-                                      num_rounds=3):
+                                      num_rounds=3,
+                                      method="approximate"):
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "kruskal",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.kruskal(x, y).statistic,
             seed=0)
         if p_value < pvalue_threshold:
             return False
@@ -173,13 +213,14 @@ class ColumnarData():
 
     def mann_whitney_u_similar_distribution(self, column,
                                             pvalue_threshold=0.05,
-                                            num_rounds=3):
+                                            num_rounds=3,
+                                            method="approximate"):
         p_value = permutation_test(
             self.new_data[column],
             self.historical_data[column],
-            method="approximate",
+            "mann_whitney_u",
+            method=method,
             num_rounds=num_rounds,
-            func=lambda x, y: stats.mannwhitneyu(x, y).statistic,
             seed=0)
 
         if p_value < pvalue_threshold:
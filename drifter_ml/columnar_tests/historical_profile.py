@@ -0,0 +1,125 @@
+import json
+import numpy as np
+from .. import robust_statistics
+
+DEFAULT_QUANTILE_LEVELS = np.linspace(0, 1, 101)
+
+class ColumnProfile():
+    def __init__(self, count, mean, std, median, iqr, q1, q3,
+                 trimean, trimean_absolute_deviation,
+                 quantile_levels, quantiles, edge_cdf=None):
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.median = median
+        self.iqr = iqr
+        self.q1 = q1
+        self.q3 = q3
+        self.trimean = trimean
+        self.trimean_absolute_deviation = trimean_absolute_deviation
+        self.quantile_levels = np.asarray(quantile_levels, dtype=float)
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        # the historical ecdf at each stored quantile; with ties it differs
+        # from the quantile levels.  Profiles saved without it fall back to
+        # the levels.
+        if edge_cdf is None:
+            edge_cdf = self.quantile_levels
+        self.edge_cdf = np.asarray(edge_cdf, dtype=float)
+
+    @classmethod
+    def from_data(cls, data, quantile_levels=DEFAULT_QUANTILE_LEVELS):
+        values = np.asarray(data)
+        summary = robust_statistics.robust_summary(values)
+        quantiles = np.quantile(values, quantile_levels)
+        ordered = np.sort(values[~np.isnan(values)])
+        edge_cdf = np.searchsorted(ordered, quantiles, side="right") / float(max(len(ordered), 1))
+        return cls(count=int(len(values)),
+                   mean=float(np.nanmean(values)),
+                   std=float(np.nanstd(values)),
+                   median=summary["median"],
+                   iqr=summary["iqr"],
+                   q1=summary["q1"],
+                   q3=summary["q3"],
+                   trimean=summary["trimean"],
+                   trimean_absolute_deviation=summary["trimean_absolute_deviation"],
+                   quantile_levels=quantile_levels,
+                   quantiles=quantiles,
+                   edge_cdf=edge_cdf)
+
+    def cdf(self, values):
+        # piecewise linear interpolation of the stored quantiles
+        return np.interp(values, self.quantiles, self.quantile_levels)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "median": self.median,
+            "iqr": self.iqr,
+            "q1": self.q1,
+            "q3": self.q3,
+            "trimean": self.trimean,
+            "trimean_absolute_deviation": self.trimean_absolute_deviation,
+            "quantile_levels": self.quantile_levels.tolist(),
+            "quantiles": self.quantiles.tolist(),
+            "edge_cdf": self.edge_cdf.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, profile):
+        return cls(**profile)
+
+# Summary statistics of the historical data, computed once per column and
+# reused for every incoming batch.  Profiles can be saved to and loaded
+# from json so that history never has to be rescanned between runs.
+class HistoricalProfile():
+    def __init__(self, historical_data=None, columns=None,
+                 quantile_levels=DEFAULT_QUANTILE_LEVELS):
+        self.historical_data = historical_data
+        self.quantile_levels = np.asarray(quantile_levels, dtype=float)
+        self.columns = {}
+        for column in (columns or []):
+            self[column]
+
+    @classmethod
+    def from_data(cls, historical_data, columns=None,
+                  quantile_levels=DEFAULT_QUANTILE_LEVELS):
+        if columns is None:
+            columns = list(historical_data.select_dtypes(include=[np.number]).columns)
+        return cls(historical_data, columns, quantile_levels)
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            if self.historical_data is None:
+                raise KeyError("{} is not in the profile and no historical data "
+                               "is available to build it".format(column))
+            self.columns[column] = ColumnProfile.from_data(
+                self.historical_data[column], self.quantile_levels)
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def to_dict(self):
+        return {
+            "quantile_levels": self.quantile_levels.tolist(),
+            "columns": {column: profile.to_dict()
+                        for column, profile in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, profile_dict):
+        profile = cls(quantile_levels=profile_dict["quantile_levels"])
+        profile.columns = {column: ColumnProfile.from_dict(column_profile)
+                           for column, column_profile in profile_dict["columns"].items()}
+        return profile
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+def _bit_length(values):
+    # exact bit length of uint64 values: float64 holds any 32 bit half
+    # exactly, so frexp's exponent is the bit length of that half
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    high_length = np.frexp(high)[1]
+    return np.where(high_length > 0, high_length + 32, np.frexp(low)[1])
+
+class HyperLogLog():
+    # Distinct count sketch with 2 ** precision one byte registers and a
+    # relative standard error of 1.04 / sqrt(2 ** precision), 0.8% at the
+    # default precision.  Values are hashed with pandas' 64 bit hash, so
+    # sketches built from separate chunks or processes merge exactly.
+    def __init__(self, precision=14, chunk_size=2 ** 20):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18, got {}".format(precision))
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.registers = np.zeros(2 ** precision, dtype=np.uint8)
+
+    def update(self, data):
+        values = np.asarray(data).ravel()
+        suffix_bits = 64 - self.precision
+        for start in range(0, len(values), self.chunk_size):
+            hashes = pd.util.hash_array(values[start:start + self.chunk_size])
+            index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+            suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+            # position of the leftmost one bit in the suffix
+            rank = (suffix_bits + 1 - _bit_length(suffix)).astype(np.uint8)
+            np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("can't merge sketches of precision {} and {}".format(
+                self.precision, other.precision))
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self):
+        n_registers = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / n_registers)
+        raw = alpha * n_registers ** 2 / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        empty = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * n_registers and empty > 0:
+            # linear counting is more accurate for small cardinalities
+            return float(n_registers * np.log(n_registers / float(empty)))
+        return float(raw)
+
+    def error_bounds(self, confidence=0.95):
+        estimate = self.estimate()
+        spread = stats.norm.ppf(0.5 + confidence / 2) * self.relative_error * estimate
+        return max(estimate - spread, 0.0), estimate + spread
@@ -0,0 +1,167 @@
+import numpy as np
+from scipy import stats
+
+# Batched permutation testing.  Every round is one row of a permutation
+# matrix, and each statistic below is computed for a whole block of rows
+# at once.  Blocks are sized so that at most max_block_elements entries
+# of the (rounds x samples) matrix are alive at any one time.
+
+def _rowwise_pearson(a, b):
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    numerator = (a * b).sum(axis=1)
+    denominator = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator
+
+def _split(pooled, permutations, m):
+    values = pooled[permutations]
+    return values[:, :m], values[:, m:]
+
+def _require_equal_sizes(m, n, name):
+    if m != n:
+        raise ValueError("{} needs samples of equal length, got {} and {}".format(name, m, n))
+
+class _Statistic():
+    def __init__(self, pooled, m):
+        self.pooled = pooled
+        self.m = m
+        self.n = len(pooled) - m
+
+    def reference(self):
+        identity = np.arange(len(self.pooled))[np.newaxis, :]
+        return float(self(identity)[0])
+
+class KSStatistic(_Statistic):
+    def __init__(self, pooled, m):
+        super().__init__(pooled, m)
+        self.order = np.argsort(pooled, kind="mergesort")
+        sorted_values = pooled[self.order]
+        # the empirical cdfs are only compared at the end of each run of ties
+        self.tie_ends = np.append(sorted_values[1:] != sorted_values[:-1], True)
+
+    def __call__(self, permutations):
+        # row b sends pooled element i to position permutations[b, i], so
+        # the first sample is whatever lands in the first m positions
+        in_x = permutations[:, self.order] < self.m
+        cdf_x = np.cumsum(in_x, axis=1) / self.m
+        cdf_y = np.cumsum(~in_x, axis=1) / self.n
+        return np.abs(cdf_x - cdf_y)[:, self.tie_ends].max(axis=1)
+
+class _RankSumStatistic(_Statistic):
+    def __init__(self, pooled, m):
+        super().__init__(pooled, m)
+        self.ranks = stats.rankdata(pooled)
+
+    def rank_sums(self, permutations):
+        return (self.ranks[np.newaxis, :] * (permutations < self.m)).sum(axis=1)
+
+class MannWhitneyUStatistic(_RankSumStatistic):
+    def __call__(self, permutations):
+        return self.rank_sums(permutations) - self.m * (self.m + 1) / 2.0
+
+class KruskalStatistic(_RankSumStatistic):
+    def __init__(self, pooled, m):
+        super().__init__(pooled, m)
+        total = len(pooled)
+        _, tie_counts = np.unique(pooled, return_counts=True)
+        self.tie_correction = 1.0 - (tie_counts ** 3 - tie_counts).sum() / float(total ** 3 - total)
+        self.rank_total = total * (total + 1) / 2.0
+
+    def __call__(self, permutations):
+        total = len(self.pooled)
+        rank_sum_x = self.rank_sums(permutations)
+        rank_sum_y = self.rank_total - rank_sum_x
+        h = (12.0 / (total * (total + 1)) *
+             (rank_sum_x ** 2 / self.m + rank_sum_y ** 2 / self.n) -
+             3 * (total + 1))
+        return h / self.tie_correction
+
+class PearsonStatistic(_Statistic):
+    def __init__(self, pooled, m):
+        super().__init__(pooled, m)
+        _require_equal_sizes(self.m, self.n, "pearson")
+
+    def __call__(self, permutations):
+        return _rowwise_pearson(*_split(self.pooled, permutations, self.m))
+
+class SpearmanStatistic(PearsonStatistic):
+    def __call__(self, permutations):
+        x, y = _split(self.pooled, permutations, self.m)
+        return _rowwise_pearson(stats.rankdata(x, axis=1),
+                                stats.rankdata(y, axis=1))
+
+class WilcoxonStatistic(_Statistic):
+    def __init__(self, pooled, m):
+        super().__init__(pooled, m)
+        _require_equal_sizes(self.m, self.n, "wilcoxon")
+
+    def __call__(self, permutations):
+        x, y = _split(self.pooled, permutations, self.m)
+        difference = x - y
+        # zero differences are dropped (zero_method="wilcox"); they share
+        # the lowest ranks, so the remaining ranks just shift down
+        zeros = (difference == 0).sum(axis=1, keepdims=True)
+        ranks = stats.rankdata(np.abs(difference), axis=1) - zeros
+        r_plus = np.where(difference > 0, ranks, 0).sum(axis=1)
+        r_minus = np.where(difference < 0, ranks, 0).sum(axis=1)
+        return np.minimum(r_plus, r_minus)
+
+STATISTICS = {
+    "ks_2samp": KSStatistic,
+    "mann_whitney_u": MannWhitneyUStatistic,
+    "kruskal": KruskalStatistic,
+    "pearson": PearsonStatistic,
+    "spearman": SpearmanStatistic,
+    "wilcoxon": WilcoxonStatistic,
+}
+
+def _ks_2samp_exact(x, y):
+    # scipy < 1.7 calls the method argument mode
+    try:
+        return stats.ks_2samp(x, y, method="exact")
+    except TypeError:
+        return stats.ks_2samp(x, y, mode="exact")
+
+def _closed_form_p_value(statistic, x, y):
+    # the permutation distribution of these rank statistics is known, so
+    # P(stat >= observed) can be read off without drawing any permutations
+    if statistic == "ks_2samp":
+        return _ks_2samp_exact(x, y).pvalue
+    if statistic == "mann_whitney_u":
+        return stats.mannwhitneyu(x, y, alternative="greater").pvalue
+    if statistic == "kruskal":
+        # with two samples H is monotone in |U - mn/2|
+        return stats.mannwhitneyu(x, y, alternative="two-sided").pvalue
+    raise ValueError("no closed form p-value for {}, use method='approximate'".format(statistic))
+
+def permutation_test(x, y, statistic, num_rounds=1000, seed=None,
+                     method="approximate", max_block_elements=2 ** 22):
+    if statistic not in STATISTICS:
+        raise ValueError("statistic must be one of {}, got {}".format(
+            sorted(STATISTICS), statistic))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if method == "exact":
+        return float(_closed_form_p_value(statistic, x, y))
+    if method != "approximate":
+        raise ValueError("method must be 'approximate' or 'exact', got {}".format(method))
+
+    pooled = np.concatenate([x, y])
+    kernel = STATISTICS[statistic](pooled, len(x))
+    reference = kernel.reference()
+    rng = np.random.default_rng(seed)
+    block_rounds = max(1, max_block_elements // len(pooled))
+    at_least_as_extreme = 0
+    remaining = num_rounds
+    while remaining > 0:
+        rounds = min(block_rounds, remaining)
+        # argsort of uniform keys shuffles every row independently; unlike
+        # Generator.permuted it works on numpy < 1.20
+        permutations = np.argsort(rng.random((rounds, len(pooled))), axis=1)
+        values = kernel(permutations)
+        at_least_as_extreme += int(np.count_nonzero(
+            (values > reference) | np.isclose(values, reference)))
+        remaining -= rounds
+    # the observed arrangement counts as one of the permutations
+    return (at_least_as_extreme + 1.0) / (num_rounds + 1.0)
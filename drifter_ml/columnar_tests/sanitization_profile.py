@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from .hyperloglog import HyperLogLog
+
+FIELDS = ["count", "nulls", "distinct", "min", "max", "negative", "zero", "positive"]
+
+def _column_dtype(data, column):
+    if hasattr(data, "dtypes"):
+        return data.dtypes[column]
+    return data.column_array(column).dtype
+
+def _block_dtype(dtype):
+    # numpy dtype a column is profiled as, or None for non-numeric columns;
+    # nullable extension dtypes (Int64, Float64, boolean) become floats
+    # with their missing values as nan
+    if pd.api.types.is_extension_array_dtype(dtype):
+        if pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+            return np.dtype(np.float64)
+        return None
+    if pd.api.types.is_bool_dtype(dtype):
+        return np.dtype(np.int8)
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_complex_dtype(dtype):
+        return np.dtype(dtype)
+    return None
+
+def _column_block(data, columns, dtype):
+    na_value = np.nan if dtype.kind == "f" else None
+    if hasattr(data, "to_numpy"):
+        if na_value is None:
+            return data[columns].to_numpy(dtype=dtype)
+        return data[columns].to_numpy(dtype=dtype, na_value=na_value)
+    return np.column_stack([np.asarray(data.column_array(column), dtype=dtype)
+                            for column in columns])
+
+def _sorted_block_profile(ordered):
+    # ordered holds one sorted column per column, nans last.  Every field
+    # comes out of column wise reductions over the sorted block.
+    n_rows = len(ordered)
+    if ordered.dtype.kind == "f":
+        missing = np.isnan(ordered)
+        nulls = missing.sum(axis=0)
+        changes = (ordered[1:] != ordered[:-1]) & ~missing[1:]
+    else:
+        nulls = np.zeros(ordered.shape[1], dtype=np.int64)
+        changes = ordered[1:] != ordered[:-1]
+    present = n_rows - nulls
+    has_values = present > 0
+    last = np.maximum(present - 1, 0)
+    columns = np.arange(ordered.shape[1])
+    minimum = ordered[0] if n_rows else np.zeros(ordered.shape[1])
+    maximum = ordered[last, columns] if n_rows else np.zeros(ordered.shape[1])
+    return {
+        "count": np.full(ordered.shape[1], n_rows),
+        "nulls": nulls,
+        "distinct": changes.sum(axis=0) + has_values + (nulls > 0),
+        "min": np.where(has_values, minimum, np.nan),
+        "max": np.where(has_values, maximum, np.nan),
+        "negative": (ordered < 0).sum(axis=0),
+        "zero": (ordered == 0).sum(axis=0),
+        "positive": (ordered > 0).sum(axis=0),
+    }
+
+def _block_reductions(block):
+    # every field but distinct, from plain column wise reductions
+    n_rows = len(block)
+    if block.dtype.kind == "f":
+        nulls = np.isnan(block).sum(axis=0)
+    else:
+        nulls = np.zeros(block.shape[1], dtype=np.int64)
+    has_values = n_rows - nulls > 0
+    with np.errstate(invalid="ignore"):
+        minimum = np.fmin.reduce(block, axis=0) if n_rows else np.zeros(block.shape[1])
+        maximum = np.fmax.reduce(block, axis=0) if n_rows else np.zeros(block.shape[1])
+    return {
+        "count": np.full(block.shape[1], n_rows),
+        "nulls": nulls,
+        "min": np.where(has_values, minimum, np.nan),
+        "max": np.where(has_values, maximum, np.nan),
+        "negative": (block < 0).sum(axis=0),
+        "zero": (block == 0).sum(axis=0),
+        "positive": (block > 0).sum(axis=0),
+    }
+
+# Null, distinct, min/max and sign counts of every column, from one sort
+# of each dtype's block of columns.  Range checks sort their column on
+# first use and keep it, so later ones are two binary searches away.
+# Non-numeric columns get null and distinct counts from pandas.  With
+# approximate=True nothing is sorted: every distinct count comes from a
+# HyperLogLog sketch, which needs no hash table or sorted copy of the
+# column, and the other fields from plain reductions.
+class SanitizationProfile():
+    def __init__(self, data, columns=None, approximate=False, precision=14):
+        self.data = data
+        if columns is None:
+            columns = list(data.columns)
+        self.n_rows = len(data)
+        self.approximate = approximate
+        self.sorted_values = {}
+        self.sketches = {}
+        self.block_dtypes = {}
+        by_dtype = {}
+        other = []
+        for column in columns:
+            dtype = _block_dtype(_column_dtype(data, column))
+            if dtype is None:
+                other.append(column)
+            else:
+                self.block_dtypes[column] = dtype
+                by_dtype.setdefault(dtype, []).append(column)
+        frames = []
+        for dtype, block_columns in by_dtype.items():
+            block = _column_block(data, block_columns, dtype)
+            if approximate:
+                fields = _block_reductions(block)
+            else:
+                fields = _sorted_block_profile(np.sort(block, axis=0))
+            frames.append(pd.DataFrame(fields, index=block_columns))
+        if other:
+            other_fields = {
+                "count": self.n_rows,
+                "nulls": [int(data[column].isnull().sum()) for column in other],
+            }
+            if not approximate:
+                other_fields["distinct"] = [int(data[column].nunique(dropna=False))
+                                            for column in other]
+            frames.append(pd.DataFrame(other_fields, index=other))
+        table = pd.concat(frames, sort=False) if frames else pd.DataFrame(columns=FIELDS)
+        self.table = table.reindex(index=columns, columns=FIELDS)
+        if approximate:
+            for column in columns:
+                self.sketches[column] = HyperLogLog(precision).update(data[column])
+                self.table.at[column, "distinct"] = min(self.sketches[column].estimate(),
+                                                        self.n_rows)
+
+    def __getitem__(self, column):
+        return self.table.loc[column]
+
+    def __contains__(self, column):
+        return column in self.table.index
+
+    def get(self, column, field):
+        return self.table.at[column, field]
+
+    def distinct_bounds(self, column, confidence=0.95):
+        if self.approximate:
+            lower, upper = self.sketches[column].error_bounds(confidence)
+            return min(lower, self.n_rows), min(upper, self.n_rows)
+        distinct = self.get(column, "distinct")
+        return distinct, distinct
+
+    def range_hits(self, column, lower_bound, upper_bound):
+        # values with lower_bound <= value <= upper_bound
+        if column in self.block_dtypes:
+            if column not in self.sorted_values:
+                values = _column_block(self.data, [column], self.block_dtypes[column])
+                self.sorted_values[column] = np.sort(values[:, 0])
+            ordered = self.sorted_values[column]
+            lower = np.searchsorted(ordered, lower_bound, side="left")
+            upper = np.searchsorted(ordered, upper_bound, side="right")
+            return int(max(upper - lower, 0))
+        values = self.data[column]
+        return int(((values >= lower_bound) & (values <= upper_bound)).sum())
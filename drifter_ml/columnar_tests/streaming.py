@@ -0,0 +1,237 @@
+import numpy as np
+from scipy import stats
+from .historical_profile import HistoricalProfile
+
+def _as_values(data):
+    values = np.asarray(data, dtype=float).ravel()
+    return values[~np.isnan(values)]
+
+class RunningMoments():
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, data):
+        values = _as_values(data)
+        if len(values) == 0:
+            return self
+        other = RunningMoments()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        return self.merge(other)
+
+    def merge(self, other):
+        # Chan et al.'s pairwise combination of Welford accumulators
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self):
+        if self.count == 0:
+            return float("nan")
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+
+class QuantileSketch():
+    # A mergeable compactor sketch: level h holds items of weight 2**h and
+    # at most k of them, so memory is O(k log(n / k)) however long the
+    # stream runs.
+    def __init__(self, k=256, seed=None):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, data):
+        values = _as_values(data)
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.k:
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # an odd item out stays behind at this level
+                leftover = items[len(items) - len(items) % 2:]
+                pairs = items[:len(items) - len(items) % 2]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[level] = leftover
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def _weighted_items(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="mergesort")
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        values, cumulative_weights = self._weighted_items()
+        if len(values) == 0:
+            return np.full(np.shape(q), np.nan)
+        targets = np.asarray(q) * cumulative_weights[-1]
+        positions = np.searchsorted(cumulative_weights, targets, side="left")
+        return values[np.clip(positions, 0, len(values) - 1)]
+
+    def cdf(self, x):
+        values, cumulative_weights = self._weighted_items()
+        if len(values) == 0:
+            return np.full(np.shape(x), np.nan)
+        positions = np.searchsorted(values, x, side="right")
+        totals = np.concatenate([[0.0], cumulative_weights])
+        return totals[positions] / cumulative_weights[-1]
+
+    def __len__(self):
+        return sum(len(items) for items in self.levels)
+
+class StreamingHistogram():
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        # one bin below the first edge, one above the last
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    def update(self, data):
+        values = _as_values(data)
+        # bin i holds values above exactly i edges, so that cumulative
+        # counts are the values <= each edge, ties included
+        bins = np.searchsorted(self.edges, values, side="left")
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def cdf_at_edges(self):
+        # fraction of the stream <= each edge
+        return np.cumsum(self.counts)[:-1] / max(self.count, 1)
+
+class ColumnStream():
+    def __init__(self, profile, sketch_size=256, seed=None):
+        self.moments = RunningMoments()
+        self.sketch = QuantileSketch(sketch_size, seed)
+        self.histogram = StreamingHistogram(profile.quantiles)
+
+    def update(self, data):
+        self.moments.update(data)
+        self.sketch.update(data)
+        self.histogram.update(data)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.histogram.merge(other.histogram)
+        return self
+
+# Streaming counterpart of ColumnarData.  Chunks (DataFrames, dicts of
+# arrays, or anything with to_pandas(), e.g. arrow record batches) are
+# folded into per column state of bounded size: Welford moments, a
+# quantile sketch, and a histogram over the historical quantiles.
+class StreamingColumnarData():
+    def __init__(self, historical, columns, sketch_size=256, seed=None):
+        if not isinstance(historical, HistoricalProfile):
+            historical = HistoricalProfile.from_data(historical, columns)
+        self.historical_profile = historical
+        self.columns = list(columns)
+        self.streams = {column: ColumnStream(self.historical_profile[column],
+                                             sketch_size, seed)
+                        for column in self.columns}
+
+    def update(self, chunk):
+        if hasattr(chunk, "to_pandas"):
+            chunk = chunk.to_pandas()
+        for column in self.columns:
+            self.streams[column].update(chunk[column])
+        return self
+
+    def consume(self, chunks):
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def monitor(self, chunks, tolerance=2, pvalue_threshold=0.05):
+        for chunk in chunks:
+            self.update(chunk)
+            yield {column: self.verdicts(column, tolerance, pvalue_threshold)
+                   for column in self.columns}
+
+    def merge(self, other):
+        for column in self.columns:
+            self.streams[column].merge(other.streams[column])
+        return self
+
+    def _within(self, value, center, spread, tolerance):
+        return center - spread * tolerance <= value <= center + spread * tolerance
+
+    def mean_similarity(self, column, tolerance=2):
+        profile = self.historical_profile[column]
+        return self._within(self.streams[column].moments.mean,
+                            profile.mean, profile.std, tolerance)
+
+    def median_similarity(self, column, tolerance=2):
+        profile = self.historical_profile[column]
+        return self._within(float(self.streams[column].sketch.quantile(0.5)),
+                            profile.median, profile.iqr, tolerance)
+
+    def trimean_similarity(self, column, tolerance=2):
+        profile = self.historical_profile[column]
+        q1, median, q3 = self.streams[column].sketch.quantile([0.25, 0.5, 0.75])
+        return self._within(float((q1 + 2*median + q3)/4),
+                            profile.trimean, profile.trimean_absolute_deviation,
+                            tolerance)
+
+    def ks_statistic(self, column):
+        profile = self.historical_profile[column]
+        stream_cdf = self.streams[column].histogram.cdf_at_edges()
+        return float(np.max(np.abs(stream_cdf - profile.edge_cdf)))
+
+    def ks_2samp_similar_distribution(self, column, pvalue_threshold=0.05):
+        # asymptotic two sample KS test, with the distance measured at the
+        # historical quantiles
+        n = self.historical_profile[column].count
+        m = self.streams[column].histogram.count
+        if m == 0:
+            return True
+        effective_size = np.sqrt(n * m / float(n + m))
+        p_value = stats.kstwobign.sf(effective_size * self.ks_statistic(column))
+        return p_value >= pvalue_threshold
+
+    def verdicts(self, column, tolerance=2, pvalue_threshold=0.05):
+        return {
+            "mean": self.mean_similarity(column, tolerance),
+            "median": self.median_similarity(column, tolerance),
+            "trimean": self.trimean_similarity(column, tolerance),
+            "ks_2samp": self.ks_2samp_similar_distribution(column, pvalue_threshold),
+        }
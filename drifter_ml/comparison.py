@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from joblib import delayed
+from sklearn.base import is_classifier
+from .execution import get_execution_config
+from .inference import chunked_predict
+from . import data_sources
+from . import significance
+from .classification_tests.per_class import confusion_matrix_metrics
+
+# Higher is better for every classification metric, lower for regression.
+CLASSIFICATION_METRICS = ["accuracy", "precision", "recall", "f1"]
+REGRESSION_METRICS = ["mse", "mae", "median_ae", "r2"]
+LOWER_IS_BETTER = {"mse", "mae", "median_ae"}
+
+def _divide(numerator, denominator):
+    result = np.zeros(np.broadcast(numerator, denominator).shape, dtype=float)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+def batched_confusion_matrices(y_true, predictions):
+    # one bincount over (model, true, predicted) codes gives every model's
+    # confusion matrix at once
+    y_true = np.asarray(y_true)
+    predictions = np.asarray(predictions)
+    labels, codes = np.unique(np.concatenate([y_true, predictions.ravel()]),
+                              return_inverse=True)
+    codes = codes.reshape(-1)
+    n_labels = len(labels)
+    n_models, n_samples = predictions.shape
+    true_codes = codes[:n_samples]
+    pred_codes = codes[n_samples:].reshape(n_models, n_samples)
+    flat = (np.arange(n_models)[:, np.newaxis] * n_labels * n_labels +
+            true_codes[np.newaxis, :] * n_labels + pred_codes)
+    counts = np.bincount(flat.ravel(), minlength=n_models * n_labels * n_labels)
+    return labels, counts.reshape(n_models, n_labels, n_labels)
+
+def classification_metrics(y_true, predictions):
+    _, matrices = batched_confusion_matrices(y_true, predictions)
+    return confusion_matrix_metrics(matrices)
+
+def regression_metrics(y_true, predictions):
+    y_true = np.asarray(y_true, dtype=float)
+    errors = np.asarray(predictions, dtype=float) - y_true[np.newaxis, :]
+    squared = errors ** 2
+    absolute = np.abs(errors)
+    total = ((y_true - y_true.mean()) ** 2).sum()
+    return {
+        "mse": squared.mean(axis=1),
+        "mae": absolute.mean(axis=1),
+        "median_ae": np.median(absolute, axis=1),
+        "r2": 1 - _divide(squared.sum(axis=1), total),
+    }
+
+def _model_names(models):
+    if isinstance(models, dict):
+        return list(models.keys()), list(models.values())
+    names = []
+    for index, model in enumerate(models):
+        names.append("{}_{}".format(type(model).__name__, index))
+    return names, list(models)
+
+# Compares any number of fitted models on one holdout.  Each model is
+# predicted once (in parallel across models), every metric is computed
+# for all models in a single vectorized pass, and pairwise significance
+# comes from McNemar's test for classifiers and a paired t test on
+# squared errors for regressors.
+class ModelComparison():
+    def __init__(self,
+                 models,
+                 test_data,
+                 target_name,
+                 column_names,
+                 task=None,
+                 execution_config=None):
+        self.names, self.models = _model_names(models)
+        test_data = data_sources.as_data(test_data)
+        self.test_data = test_data
+        self.target_name = target_name
+        self.column_names = column_names
+        self.y = test_data[target_name]
+        self.X = test_data[column_names]
+        if task is None:
+            task = "classification" if is_classifier(self.models[0]) else "regression"
+        if task not in ("classification", "regression"):
+            raise ValueError("task must be 'classification' or 'regression', got {}".format(task))
+        self.task = task
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self._predictions = None
+
+    def predictions(self):
+        if self._predictions is None:
+            parallel = self.execution_config.parallel(prefer="threads")
+            predictions = parallel(delayed(chunked_predict)(model, "predict", self.X,
+                                                            self.execution_config)
+                                   for model in self.models)
+            self._predictions = np.vstack([np.asarray(prediction).reshape(1, -1)
+                                           for prediction in predictions])
+        return self._predictions
+
+    def invalidate_predictions(self):
+        self._predictions = None
+
+    def metrics(self):
+        if self.task == "classification":
+            scores = classification_metrics(self.y, self.predictions())
+        else:
+            scores = regression_metrics(self.y, self.predictions())
+        return pd.DataFrame(scores, index=pd.Index(self.names, name="model"))
+
+    def leaderboard(self, metric=None):
+        if metric is None:
+            metric = "f1" if self.task == "classification" else "mse"
+        table = self.metrics()
+        if metric not in table.columns:
+            raise ValueError("metric must be one of {}, got {}".format(
+                list(table.columns), metric))
+        table = table.sort_values(metric, ascending=metric in LOWER_IS_BETTER,
+                                  kind="mergesort")
+        table.insert(0, "rank", np.arange(1, len(table) + 1))
+        return table
+
+    def losses(self):
+        predictions = self.predictions()
+        y_true = np.asarray(self.y)
+        if self.task == "classification":
+            return (predictions != y_true[np.newaxis, :]).astype(float)
+        return (predictions.astype(float) - y_true[np.newaxis, :]) ** 2
+
+    def pairwise_significance(self, correction="holm"):
+        if self.task == "classification":
+            _, p_values = significance.pairwise_mcnemar(self.y, self.predictions())
+        else:
+            _, p_values = significance.pairwise_paired_t_test(self.losses())
+        if correction == "holm":
+            upper = np.triu_indices(len(self.models), k=1)
+            adjusted = np.ones_like(p_values)
+            adjusted[upper] = significance.holm_correction(p_values[upper])
+            p_values = np.minimum(adjusted, adjusted.T)
+        elif correction is not None:
+            raise ValueError("correction must be 'holm' or None, got {}".format(correction))
+        return pd.DataFrame(p_values, index=self.names, columns=self.names)
+
+    def significantly_different(self, alpha=0.05, correction="holm"):
+        p_values = self.pairwise_significance(correction)
+        return p_values < alpha
@@ -0,0 +1,122 @@
+import hashlib
+import warnings
+import numpy as np
+import pandas as pd
+from sklearn.base import clone, is_classifier
+from sklearn.model_selection import check_cv
+from joblib import delayed
+from .execution import get_execution_config
+
+def _take(data, indices):
+    if hasattr(data, "iloc"):
+        return data.iloc[indices]
+    return np.take(data, indices, axis=0)
+
+def _is_plain_numeric(dtype):
+    return (pd.api.types.is_numeric_dtype(dtype)
+            and not pd.api.types.is_extension_array_dtype(dtype))
+
+def as_fold_array(data, columns=None, estimator=None):
+    # folds are positional takes on one contiguous array, filled column by
+    # column straight from the source so no intermediate frame is built.
+    # Estimators fit on column names, and columns that are not plain
+    # numbers, get the frame instead.
+    if columns is None:
+        if not hasattr(data, "columns"):
+            return np.ascontiguousarray(np.asarray(data))
+        columns = list(data.columns)
+    series = [data[column] for column in columns]
+    if (hasattr(estimator, "feature_names_in_")
+            or not all(_is_plain_numeric(values.dtype) for values in series)):
+        return data[columns]
+    array = np.empty((len(data), len(columns)),
+                     dtype=np.result_type(*[values.dtype for values in series]))
+    for position, values in enumerate(series):
+        array[:, position] = values.to_numpy()
+    return array
+
+class FoldResult():
+    def __init__(self, train_index, test_index, y_true, y_pred):
+        self.train_index = train_index
+        self.test_index = test_index
+        self.y_true = y_true
+        self.y_pred = y_pred
+
+def _fit_fold(estimator, X, y, train, test):
+    estimator = clone(estimator)
+    estimator.fit(_take(X, train), _take(y, train))
+    y_pred = estimator.predict(_take(X, test))
+    return FoldResult(train, test, _take(y, test), y_pred)
+
+# Fits every fold of a splitter exactly once and keeps the out-of-fold
+# predictions around, so any number of metrics can be scored from a
+# single set of fits.
+class CrossValidationEngine():
+    def __init__(self, estimator, X, y, execution_config=None, columns=None):
+        self.estimator = estimator
+        self.X = X
+        self.y = y
+        self.columns = columns
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self._fold_results = {}
+        self._fold_arrays = None
+
+    def fold_arrays(self):
+        if self._fold_arrays is None:
+            self._fold_arrays = (as_fold_array(self.X, self.columns, self.estimator),
+                                 as_fold_array(self.y))
+        return self._fold_arrays
+
+    def splits(self, cv):
+        X, y = self.fold_arrays()
+        splitter = check_cv(cv, self.y,
+                            classifier=is_classifier(self.estimator))
+        return [(np.asarray(train), np.asarray(test))
+                for train, test in splitter.split(X, y)]
+
+    def splitter_key(self, splits):
+        # folds are cached under a digest of the indices they hold; the
+        # repr of a splitter abbreviates long index arrays, so different
+        # explicit splits could share one
+        digest = hashlib.sha1()
+        for train, test in splits:
+            digest.update(np.ascontiguousarray(train, dtype=np.int64).tobytes())
+            digest.update(b"|")
+            digest.update(np.ascontiguousarray(test, dtype=np.int64).tobytes())
+            digest.update(b"/")
+        return digest.hexdigest()
+
+    def fold_results(self, cv):
+        splits = self.splits(cv)
+        key = self.splitter_key(splits)
+        if key not in self._fold_results:
+            self._fold_results[key] = self._fit_folds(splits)
+        return self._fold_results[key]
+
+    def _fit_folds(self, splits):
+        # joblib hands results back in submission order, so folds come
+        # out in split order whatever finishes first
+        # process backends memmap the arrays instead of pickling them per fold
+        X, y = self.fold_arrays()
+        parallel = self.execution_config.parallel()
+        return parallel(delayed(_fit_fold)(self.estimator, X, y, train, test)
+                        for train, test in splits)
+
+    def scores(self, cv, metric, error_score=np.nan):
+        # mirrors cross_validate: a metric that can't be computed on a
+        # fold is reported as error_score rather than raised
+        scores = []
+        for fold in self.fold_results(cv):
+            try:
+                scores.append(metric(fold.y_true, fold.y_pred))
+            except Exception as error:
+                warnings.warn("Scoring failed. The score on this fold will "
+                              "be set to {}. Details: {!r}".format(error_score, error))
+                scores.append(error_score)
+        return scores
+
+    def invalidate(self):
+        self._fold_results = {}
+        self._fold_arrays = None
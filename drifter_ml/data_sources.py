@@ -0,0 +1,144 @@
+import os
+import numpy as np
+import pandas as pd
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("reading parquet or arrow data requires pyarrow, "
+                          "install it with `pip install pyarrow`")
+    return pyarrow
+
+# Column oriented views over data that may not fit in memory.  A source
+# looks enough like a DataFrame for the test suites: source[column] is a
+# Series over a zero-copy view of that column where the format allows it,
+# and source[[columns]] materializes only the columns asked for.
+class DataSource():
+    def __init__(self):
+        self._arrays = {}
+
+    @property
+    def columns(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def _read_column(self, column):
+        raise NotImplementedError
+
+    def column_array(self, column):
+        if column not in self._arrays:
+            if column not in self.columns:
+                raise KeyError(column)
+            self._arrays[column] = self._read_column(column)
+        return self._arrays[column]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return pd.Series(self.column_array(key), name=key, copy=False)
+        key = list(key)
+        return pd.DataFrame({column: self.column_array(column) for column in key},
+                            columns=key)
+
+    def __contains__(self, column):
+        return column in self.columns
+
+class ParquetSource(DataSource):
+    def __init__(self, path):
+        super().__init__()
+        pyarrow = _import_pyarrow()
+        self.path = path
+        self.metadata = pyarrow.parquet.ParquetFile(path).metadata
+        self._columns = list(self.metadata.schema.to_arrow_schema().names)
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def __len__(self):
+        return self.metadata.num_rows
+
+    def _read_column(self, column):
+        pyarrow = _import_pyarrow()
+        table = pyarrow.parquet.read_table(self.path, columns=[column],
+                                           memory_map=True)
+        return table.column(column).to_numpy()
+
+class ArrowSource(DataSource):
+    def __init__(self, data):
+        super().__init__()
+        pyarrow = _import_pyarrow()
+        if isinstance(data, (str, os.PathLike)):
+            # arrow ipc / feather v2 files are memory mapped, so columns
+            # without nulls are read straight out of the page cache
+            data = pyarrow.ipc.open_file(pyarrow.memory_map(os.fspath(data))).read_all()
+        self.table = data
+
+    @property
+    def columns(self):
+        return list(self.table.column_names)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def _read_column(self, column):
+        chunked = self.table.column(column)
+        if chunked.num_chunks == 1 and chunked.null_count == 0:
+            return chunked.chunk(0).to_numpy(zero_copy_only=False)
+        return chunked.to_numpy()
+
+class MemmapSource(DataSource):
+    def __init__(self, data, columns=None):
+        super().__init__()
+        if isinstance(data, (str, os.PathLike)):
+            data = np.load(os.fspath(data), mmap_mode="r")
+        self.array = data
+        if data.dtype.names is not None:
+            self._columns = list(data.dtype.names)
+        else:
+            if data.ndim != 2:
+                raise ValueError("expected a structured or two dimensional array, "
+                                 "got {} dimensions".format(data.ndim))
+            self._columns = list(columns) if columns is not None else [
+                str(index) for index in range(data.shape[1])]
+            if len(self._columns) != data.shape[1]:
+                raise ValueError("got {} column names for {} columns".format(
+                    len(self._columns), data.shape[1]))
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def __len__(self):
+        return len(self.array)
+
+    def _read_column(self, column):
+        if self.array.dtype.names is not None:
+            return self.array[column]
+        return self.array[:, self._columns.index(column)]
+
+SUFFIXES = {
+    ".parquet": ParquetSource,
+    ".pq": ParquetSource,
+    ".arrow": ArrowSource,
+    ".feather": ArrowSource,
+    ".ipc": ArrowSource,
+    ".npy": MemmapSource,
+}
+
+def as_data(data):
+    if isinstance(data, (str, os.PathLike)):
+        suffix = os.path.splitext(os.fspath(data))[1].lower()
+        if suffix not in SUFFIXES:
+            raise ValueError("can't tell the format of {}, expected one of {}".format(
+                data, sorted(SUFFIXES)))
+        return SUFFIXES[suffix](data)
+    if type(data).__module__.startswith("pyarrow") and hasattr(data, "column_names"):
+        return ArrowSource(data)
+    if isinstance(data, np.ndarray) and data.dtype.names is not None:
+        return MemmapSource(data)
+    return data
@@ -0,0 +1,60 @@
+from joblib import Parallel
+try:
+    from joblib import parallel_config
+    # joblib >= 1.3 can hand results back as they complete
+    GENERATOR_KWARGS = {"return_as": "generator"}
+except ImportError:
+    # joblib < 1.3, the last releases for python 3.6
+    from joblib import parallel_backend as parallel_config
+    GENERATOR_KWARGS = {}
+
+class _NullContext():
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+class ExecutionConfig():
+    def __init__(self, n_jobs=None, backend=None, pre_dispatch="2*n_jobs",
+                 chunk_size=None):
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.pre_dispatch = pre_dispatch
+        # rows per predict call on held out data, None predicts in one call
+        self.chunk_size = chunk_size
+
+    def parallel(self, **kwargs):
+        return Parallel(n_jobs=self.n_jobs,
+                        backend=self.backend,
+                        pre_dispatch=self.pre_dispatch,
+                        **kwargs)
+
+    def backend_context(self):
+        # scopes the backend for sklearn helpers (cross_validate,
+        # cross_val_predict) that only take n_jobs and pre_dispatch
+        if self.backend is None:
+            return _NullContext()
+        return parallel_config(self.backend)
+
+    def sklearn_kwargs(self):
+        return {"n_jobs": self.n_jobs, "pre_dispatch": self.pre_dispatch}
+
+    def __repr__(self):
+        return ("ExecutionConfig(n_jobs={!r}, backend={!r}, pre_dispatch={!r}, "
+                "chunk_size={!r})".format(self.n_jobs, self.backend,
+                                          self.pre_dispatch, self.chunk_size))
+
+_execution_config = ExecutionConfig()
+
+def get_execution_config():
+    return _execution_config
+
+def set_execution_config(n_jobs=None, backend=None, pre_dispatch="2*n_jobs",
+                         chunk_size=None):
+    global _execution_config
+    _execution_config = ExecutionConfig(n_jobs=n_jobs,
+                                        backend=backend,
+                                        pre_dispatch=pre_dispatch,
+                                        chunk_size=chunk_size)
+    return _execution_config
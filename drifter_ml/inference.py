@@ -0,0 +1,36 @@
+import numpy as np
+from joblib import delayed
+from .execution import get_execution_config, GENERATOR_KWARGS
+
+def _rows(data, start, stop):
+    if hasattr(data, "iloc"):
+        return data.iloc[start:stop]
+    return data[start:stop]
+
+def _predict_block(model, method, block, start):
+    return start, np.asarray(getattr(model, method)(block))
+
+def chunked_predict(model, method, data, execution_config=None):
+    # Row blocks are predicted in the configured pool and copied into one
+    # preallocated output as they arrive, so at most pre_dispatch blocks of
+    # model intermediates are alive at a time (on joblib < 1.3 every block
+    # is returned before copying starts).  Threads are preferred since
+    # most estimators release the GIL in predict; an explicit backend wins.
+    if execution_config is None:
+        execution_config = get_execution_config()
+    chunk_size = execution_config.chunk_size
+    n_rows = len(data)
+    if chunk_size is None or n_rows <= chunk_size:
+        return getattr(model, method)(data)
+    blocks = (delayed(_predict_block)(model, method, _rows(data, start, start + chunk_size), start)
+              for start in range(0, n_rows, chunk_size))
+    output = None
+    for start, prediction in execution_config.parallel(prefer="threads",
+                                                       **GENERATOR_KWARGS)(blocks):
+        if output is None:
+            output = np.empty((n_rows,) + prediction.shape[1:], dtype=prediction.dtype)
+        elif not np.can_cast(prediction.dtype, output.dtype):
+            # e.g. longer class name strings turning up in a later block
+            output = output.astype(np.result_type(output.dtype, prediction.dtype))
+        output[start:start + len(prediction)] = prediction
+    return output
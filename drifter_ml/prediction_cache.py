@@ -0,0 +1,68 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from .inference import chunked_predict
+
+def fingerprint(data):
+    hasher = hashlib.sha1()
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        if isinstance(data, pd.DataFrame):
+            hasher.update(repr(list(data.columns)).encode())
+        hasher.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    else:
+        data = np.ascontiguousarray(data)
+        hasher.update(repr((data.shape, data.dtype.str)).encode())
+        hasher.update(data.view(np.uint8).tobytes() if data.dtype != object
+                      else pd.util.hash_array(data.ravel()).tobytes())
+    return hasher.hexdigest()
+
+# Memoizes model outputs keyed by (model identity, method, data fingerprint).
+# Fingerprints are computed once per data object, so a frame that is
+# mutated in place has to be dropped with invalidate(data=...) first.
+# Misses are computed with chunked_predict under the given execution config.
+class PredictionCache():
+    def __init__(self, execution_config=None):
+        self.execution_config = execution_config
+        self._predictions = {}
+        self._models = {}
+        self._fingerprints = {}
+
+    def fingerprint(self, data):
+        key = id(data)
+        if key not in self._fingerprints:
+            # hold on to the data so its id can't be recycled
+            self._fingerprints[key] = (data, fingerprint(data))
+        return self._fingerprints[key][1]
+
+    def get(self, model, method, data):
+        key = (id(model), method, self.fingerprint(data))
+        if key not in self._predictions:
+            self._models[id(model)] = model
+            self._predictions[key] = chunked_predict(model, method, data,
+                                                     self.execution_config)
+        return self._predictions[key]
+
+    def predict(self, model, data):
+        return self.get(model, "predict", data)
+
+    def predict_proba(self, model, data):
+        return self.get(model, "predict_proba", data)
+
+    def invalidate(self, model=None, data=None):
+        if data is not None:
+            data_fingerprint = self._fingerprints.pop(id(data), (None, None))[1]
+        for key in list(self._predictions):
+            model_id, _, key_fingerprint = key
+            if model is not None and model_id != id(model):
+                continue
+            if data is not None and key_fingerprint != data_fingerprint:
+                continue
+            del self._predictions[key]
+        if model is not None and data is None:
+            self._models.pop(id(model), None)
+        if model is None and data is None:
+            self._models = {}
+            self._fingerprints = {}
+
+    def __len__(self):
+        return len(self._predictions)
@@ -1,4 +1,5 @@
 from .regression_tests import RegressionTests
 from .regression_tests import RegressionComparison
+from .residuals import residual_metrics
 
-__all__ = ["RegressionTests", "RegressionComparison"]
+__all__ = ["RegressionTests", "RegressionComparison", "residual_metrics"]
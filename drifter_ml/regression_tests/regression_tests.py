@@ -2,30 +2,68 @@ from sklearn import metrics
 import numpy as np
 import time
 from scipy import stats
-from sklearn.model_selection import cross_validate, cross_val_predict
+from sklearn.model_selection import cross_val_predict
+from ..execution import get_execution_config
+from .. import benchmarking
+from ..prediction_cache import PredictionCache
+from .. import data_sources
+from .. import significance
+from ..cross_validation import CrossValidationEngine
+from .residuals import residual_metrics, pinball_name, DEFAULT_QUANTILES
 
 class RegressionTests():
     def __init__(self,
                  reg,
                  test_data,
                  target_name,
-                 column_names):
+                 column_names,
+                 execution_config=None):
         self.reg = reg
         self.column_names = column_names
         self.target_name = target_name
+        test_data = data_sources.as_data(test_data)
         self.test_data = test_data
         self.y = test_data[target_name]
-        self.X = test_data[column_names]
+        self._X = None
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self.prediction_cache = PredictionCache(execution_config)
+        self.cross_validation_engine = CrossValidationEngine(reg, test_data, self.y,
+                                                             execution_config,
+                                                             columns=column_names)
+
+    @property
+    def X(self):
+        if self._X is None:
+            self._X = self.test_data[self.column_names]
+        return self._X
+
+    def predict(self):
+        return self.prediction_cache.predict(self.reg, self.X)
+
+    def invalidate_predictions(self):
+        self.prediction_cache.invalidate()
+        self.cross_validation_engine.invalidate()
 
     def get_test_score(self, cross_val_dict):
         return list(cross_val_dict["test_score"])
 
+    def residual_metrics(self, quantiles=DEFAULT_QUANTILES):
+        return residual_metrics(self.y, self.predict(), quantiles)
+
+    def cv_residual_metrics(self, cv, quantiles=DEFAULT_QUANTILES):
+        # the folds are fit once per splitter and every cv check below
+        # reads its scores from the same out of fold residuals
+        return [residual_metrics(fold.y_true, fold.y_pred, quantiles)
+                for fold in self.cross_validation_engine.fold_results(cv)]
+
     def mse_cv(self, cv):
-        mse = metrics.make_scorer(metrics.mean_squared_error)
-        result = cross_validate(self.reg, self.X,
-                                self.y, cv=cv,
-                                scoring=(mse))
-        return self.get_test_score(result)
+        return [measures["mse"] for measures in self.cv_residual_metrics(cv, ())]
+
+    def pinball_cv(self, cv, quantile=0.5):
+        return [measures[pinball_name(quantile)]
+                for measures in self.cv_residual_metrics(cv, (quantile,))]
 
     def _cross_val_anomaly_detection(self, scores, tolerance):
         avg = np.mean(scores)
@@ -61,17 +99,14 @@ class RegressionTests():
         return self._cross_val_upper_boundary(scores, upper_boundary)
         
     def mse_upper_boundary(self, upper_boundary):
-        y_pred = self.reg.predict(self.X)
+        y_pred = self.predict()
         if metrics.mean_squared_error(self.y, y_pred) > upper_boundary:
             return False
         return True
 
     def mae_cv(self, cv):
-        mae = metrics.make_scorer(metrics.median_absolute_error)
-        result = cross_validate(self.reg, self.X,
-                                self.y, cv=cv,
-                                scoring=(mae))
-        return self.get_test_score(result)
+        # mae_cv has always scored the median absolute error
+        return [measures["median_ae"] for measures in self.cv_residual_metrics(cv, ())]
     
     def cross_val_mae_anomaly_detection(self, tolerance, cv=3):
         scores = self.mae_cv(cv)
@@ -86,7 +121,7 @@ class RegressionTests():
         return self._cross_val_upper_boundary(scores, upper_boundary)
     
     def mae_upper_boundary(self, upper_boundary):
-        y_pred = self.reg.predict(self.X)
+        y_pred = self.predict()
         if metrics.median_absolute_error(self.y, y_pred) > upper_boundary:
             return False
         return True
@@ -99,17 +134,16 @@ class RegressionTests():
         else:
             return False
 
-    def run_time_stress_test(self, performance_boundary):
-        for performance_info in performance_boundary:
-            n = int(performance_info["sample_size"])
-            max_run_time = float(performance_info["max_run_time"])
-            data = self.X.sample(n, replace=True)
-            start_time = time.time()
-            self.reg.predict(data)
-            model_run_time = time.time() - start_time
-            if model_run_time > max_run_time:
-                return False
-        return True
+    def run_time_stress_test(self, performance_boundary,
+                             warmup=1, trials=10, budget_percentile=50,
+                             random_state=None):
+        return benchmarking.run_time_stress_test(self.reg.predict,
+                                                 self.X,
+                                                 performance_boundary,
+                                                 warmup=warmup,
+                                                 trials=trials,
+                                                 budget_percentile=budget_percentile,
+                                                 random_state=random_state)
 
 class RegressionComparison():
     def __init__(self,
@@ -117,14 +151,20 @@ class RegressionComparison():
                  reg_two,
                  test_data,
                  target_name,
-                 column_names):
+                 column_names,
+                 execution_config=None):
         self.reg_one = reg_one
         self.reg_two = reg_two
         self.column_names = column_names
         self.target_name = target_name
+        test_data = data_sources.as_data(test_data)
         self.test_data = test_data
         self.y = test_data[target_name]
         self.X = test_data[column_names]
+        if execution_config is None:
+            execution_config = get_execution_config()
+        self.execution_config = execution_config
+        self.prediction_cache = PredictionCache(execution_config)
         
     def two_model_prediction_run_time_stress_test(self, performance_boundary):
         for performance_info in performance_boundary:
@@ -141,22 +181,50 @@ class RegressionComparison():
                 return False
         return True
 
+    def predict(self, reg):
+        return self.prediction_cache.predict(reg, self.X)
+
+    def invalidate_predictions(self, reg=None):
+        self.prediction_cache.invalidate(model=reg)
+
+    def _cross_val_predict(self, reg, cv):
+        with self.execution_config.backend_context():
+            return cross_val_predict(reg, self.X, self.y, cv=cv,
+                                     **self.execution_config.sklearn_kwargs())
+
     def cross_val_mse_result(self, reg, cv=3):
-        y_pred = cross_val_predict(reg, self.X, self.y)
+        y_pred = self._cross_val_predict(reg, cv)
         return metrics.mean_squared_error(self.y, y_pred)
         
     def cross_val_mae_result(self, reg, cv=3):
-        y_pred = cross_val_predict(reg, self.X, self.y)
+        y_pred = self._cross_val_predict(reg, cv)
         return metrics.median_absolute_error(self.y, y_pred)
 
     def mse_result(self, reg):
-        y_pred = reg.predict(self.X)
+        y_pred = self.predict(reg)
         return metrics.mean_squared_error(self.y, y_pred)
 
     def mae_result(self, reg):
-        y_pred = reg.predict(self.X)
+        y_pred = self.predict(reg)
         return metrics.median_absolute_error(self.y, y_pred)
 
+    def paired_bootstrap(self, n_resamples=2000, alpha=0.05, seed=None):
+        return significance.paired_bootstrap_regression(self.y,
+                                                        self.predict(self.reg_one),
+                                                        self.predict(self.reg_two),
+                                                        n_resamples=n_resamples,
+                                                        alpha=alpha,
+                                                        seed=seed)
+
+    def significant_two_model_regression_testing(self, alpha=0.05,
+                                                 n_resamples=2000, seed=None):
+        # model one only fails when its errors are significantly larger
+        results = self.paired_bootstrap(n_resamples, alpha, seed)
+        for metric in ["mse", "mae"]:
+            if results[metric]["confidence_interval"][0] > 0:
+                return False
+        return True
+
     def cv_two_model_regression_testing(self, cv=3):
         mse_one_test = self.cross_val_mse_result(self.reg_one, cv=cv)
         mae_one_test = self.cross_val_mae_result(self.reg_one, cv=cv)
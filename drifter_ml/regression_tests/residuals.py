@@ -0,0 +1,25 @@
+import numpy as np
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+def pinball_name(quantile):
+    return "pinball_{}".format(quantile)
+
+def residual_metrics(y_true, y_pred, quantiles=DEFAULT_QUANTILES):
+    # every loss is a reduction over the same residual vector, so it is
+    # computed once and shared
+    residuals = np.asarray(y_true, dtype=float) - np.asarray(y_pred, dtype=float)
+    absolute = np.abs(residuals)
+    measures = {
+        "mse": float(np.dot(residuals, residuals) / len(residuals)),
+        "mae": float(absolute.mean()),
+        "median_ae": float(np.median(absolute)),
+    }
+    if len(quantiles) > 0:
+        quantiles = np.asarray(quantiles, dtype=float)
+        # pinball loss: q * r above the quantile, (q - 1) * r below it
+        weights = quantiles[np.newaxis, :] - (residuals < 0)[:, np.newaxis]
+        losses = (residuals[:, np.newaxis] * weights).mean(axis=0)
+        for quantile, loss in zip(quantiles.tolist(), losses.tolist()):
+            measures[pinball_name(quantile)] = loss
+    return measures
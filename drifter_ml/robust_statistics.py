@@ -0,0 +1,42 @@
+import numpy as np
+
+def _as_array(data):
+    values = np.asarray(data)
+    # float32 is kept as is; ints and bools need a float copy regardless
+    if values.dtype.kind not in "fc":
+        values = values.astype(np.float64)
+    return values
+
+def quartiles(data):
+    # one selection pass for all three order statistics
+    q1, median, q3 = np.quantile(_as_array(data), [0.25, 0.5, 0.75])
+    return float(q1), float(median), float(q3)
+
+def iqr(data):
+    q1, _, q3 = quartiles(data)
+    return q3 - q1
+
+def trimean(data):
+    q1, median, q3 = quartiles(data)
+    return (q1 + 2*median + q3)/4
+
+def trimean_absolute_deviation(data, center=None):
+    values = _as_array(data)
+    if center is None:
+        center = trimean(values)
+    deviation = np.subtract(values, center, dtype=values.dtype)
+    np.abs(deviation, out=deviation)
+    return float(deviation.mean(dtype=np.float64))
+
+def robust_summary(data):
+    values = _as_array(data)
+    q1, median, q3 = quartiles(values)
+    center = (q1 + 2*median + q3)/4
+    return {
+        "q1": q1,
+        "median": median,
+        "q3": q3,
+        "iqr": q3 - q1,
+        "trimean": center,
+        "trimean_absolute_deviation": trimean_absolute_deviation(values, center),
+    }
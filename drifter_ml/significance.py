@@ -0,0 +1,222 @@
+import numpy as np
+from scipy import sparse
+from scipy import stats
+from .classification_tests.per_class import count_metrics
+
+def _mcnemar_p_values(only_first, only_second, exact_below=25):
+    # exact binomial test for small discordant counts, continuity
+    # corrected chi square otherwise
+    discordant = only_first + only_second
+    smaller = np.minimum(only_first, only_second)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistic = np.where(discordant > 0,
+                             (np.abs(only_first - only_second) - 1.0) ** 2 / discordant,
+                             0.0)
+    p_values = np.where(discordant < exact_below,
+                        np.minimum(1.0, 2 * stats.binom.cdf(smaller, discordant, 0.5)),
+                        stats.chi2.sf(statistic, 1))
+    p_values = np.where(discordant == 0, 1.0, p_values)
+    return statistic, p_values
+
+def mcnemar_test(y_true, y_pred_one, y_pred_two, exact_below=25):
+    y_true = np.asarray(y_true)
+    correct_one = np.asarray(y_pred_one) == y_true
+    correct_two = np.asarray(y_pred_two) == y_true
+    statistic, p_value = _mcnemar_p_values(
+        np.count_nonzero(correct_one & ~correct_two),
+        np.count_nonzero(~correct_one & correct_two),
+        exact_below)
+    return float(statistic), float(p_value)
+
+def pairwise_mcnemar(y_true, predictions, exact_below=25):
+    # predictions is (models, samples); the discordant counts of every
+    # pair come out of one matrix product over the correctness matrix
+    y_true = np.asarray(y_true)
+    correct = (np.asarray(predictions) == y_true[np.newaxis, :]).astype(np.int64)
+    only_first = correct @ (1 - correct).T
+    return _mcnemar_p_values(only_first, only_first.T, exact_below)
+
+def paired_t_test(losses_one, losses_two):
+    statistics, p_values = pairwise_paired_t_test(np.vstack([losses_one, losses_two]))
+    return float(statistics[0, 1]), float(p_values[0, 1])
+
+def pairwise_paired_t_test(losses):
+    # losses is (models, samples).  var(a - b) = var(a) + var(b) - 2 cov(a, b),
+    # so one covariance matrix gives the paired t statistic of every pair
+    losses = np.asarray(losses, dtype=float)
+    n_samples = losses.shape[1]
+    means = losses.mean(axis=1)
+    covariance = np.atleast_2d(np.cov(losses))
+    variances = np.diag(covariance)
+    difference_variance = variances[:, np.newaxis] + variances[np.newaxis, :] - 2 * covariance
+    difference_variance = np.maximum(difference_variance, 0.0)
+    mean_difference = means[:, np.newaxis] - means[np.newaxis, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistics = mean_difference / np.sqrt(difference_variance / n_samples)
+    p_values = 2 * stats.t.sf(np.abs(statistics), n_samples - 1)
+    # identical losses can't be told apart, constant nonzero differences can
+    constant = difference_variance == 0
+    p_values = np.where(constant, np.where(mean_difference == 0, 1.0, 0.0), p_values)
+    statistics = np.where(constant & (mean_difference == 0), 0.0, statistics)
+    return statistics, p_values
+
+def holm_correction(p_values):
+    # Holm-Bonferroni step down adjustment of a flat array of p-values
+    p_values = np.asarray(p_values, dtype=float)
+    order = np.argsort(p_values, kind="mergesort")
+    n_tests = len(p_values)
+    adjusted = np.maximum.accumulate(p_values[order] * (n_tests - np.arange(n_tests)))
+    result = np.empty(n_tests)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def _bootstrap_summary(observed, deltas, alpha):
+    # percentile interval for metric(one) - metric(two), and the two sided
+    # bootstrap p-value for "no difference"
+    lower, upper = np.quantile(deltas, [alpha / 2, 1 - alpha / 2])
+    n_resamples = len(deltas)
+    at_or_below = np.count_nonzero(deltas <= 0)
+    at_or_above = np.count_nonzero(deltas >= 0)
+    p_value = min(1.0, 2 * (min(at_or_below, at_or_above) + 1.0) / (n_resamples + 1.0))
+    return {
+        "difference": float(observed),
+        "confidence_interval": (float(lower), float(upper)),
+        "p_value": float(p_value),
+        "n_resamples": n_resamples,
+    }
+
+def _cell_indicator(cell_labels, n_labels, include=None):
+    # (cells, labels) matrix mapping each cell onto its label, so that
+    # counts @ indicator sums (resamples, cells) counts per label
+    n_cells = len(cell_labels)
+    weights = np.ones(n_cells) if include is None else include.astype(float)
+    return sparse.csr_matrix((weights, (np.arange(n_cells), cell_labels)),
+                             shape=(n_cells, n_labels))
+
+def _sum_cells(counts, indicator):
+    return np.asarray(indicator.T.dot(counts.T)).T
+
+def paired_bootstrap_classification(y_true, y_pred_one, y_pred_two,
+                                    n_resamples=2000, alpha=0.05, seed=None,
+                                    metrics=("accuracy", "precision", "recall", "f1"),
+                                    max_block_elements=2 ** 22):
+    # Every confusion matrix metric of a resample depends only on how many
+    # rows fall in each (true, one, two) label cell, and resampling rows
+    # with replacement draws those cell counts from a multinomial over the
+    # cells that occur.  There are at most min(rows, labels ** 3) of them,
+    # and resamples are drawn a block at a time so that at most
+    # max_block_elements counts are alive, whatever the number of labels.
+    labels, codes = np.unique(np.concatenate([np.asarray(y_true),
+                                              np.asarray(y_pred_one),
+                                              np.asarray(y_pred_two)]),
+                              return_inverse=True)
+    true_codes, one_codes, two_codes = codes.reshape(3, -1)
+    n_labels = len(labels)
+    joint_codes = (true_codes.astype(np.int64) * n_labels + one_codes) * n_labels + two_codes
+    cells, cell_counts = np.unique(joint_codes, return_counts=True)
+    cell_true = cells // n_labels ** 2
+    cell_one = cells // n_labels % n_labels
+    cell_two = cells % n_labels
+    support_indicator = _cell_indicator(cell_true, n_labels)
+    model_indicators = [(_cell_indicator(cell_true, n_labels, cell_pred == cell_true),
+                         _cell_indicator(cell_pred, n_labels))
+                        for cell_pred in (cell_one, cell_two)]
+    n_samples = len(joint_codes)
+    probabilities = cell_counts / float(n_samples)
+
+    def score_differences(counts):
+        support = _sum_cells(counts, support_indicator)
+        scores_one, scores_two = [count_metrics(_sum_cells(counts, hits), support,
+                                                _sum_cells(counts, predicted))
+                                  for hits, predicted in model_indicators]
+        return {metric: scores_one[metric] - scores_two[metric] for metric in metrics}
+
+    observed = score_differences(cell_counts[np.newaxis, :])
+    deltas = {metric: np.empty(n_resamples) for metric in metrics}
+    rng = np.random.default_rng(seed)
+    block_rounds = max(1, max_block_elements // max(len(cells), n_labels))
+    done = 0
+    while done < n_resamples:
+        rounds = min(block_rounds, n_resamples - done)
+        block = score_differences(rng.multinomial(n_samples, probabilities, size=rounds))
+        for metric in metrics:
+            deltas[metric][done:done + rounds] = block[metric]
+        done += rounds
+    results = {metric: _bootstrap_summary(observed[metric][0], deltas[metric], alpha)
+               for metric in metrics}
+    statistic, p_value = mcnemar_test(y_true, y_pred_one, y_pred_two)
+    results["mcnemar"] = {"statistic": statistic, "p_value": p_value}
+    return results
+
+def _exact_bootstrap_means(differences, n_resamples, rng, max_block_elements):
+    # resample indices are drawn and gathered a block at a time, keeping at
+    # most max_block_elements indices alive
+    n_samples = differences.shape[1]
+    index_dtype = np.int32 if n_samples < 2 ** 31 else np.int64
+    block_rounds = max(1, max_block_elements // n_samples)
+    means = np.empty((len(differences), n_resamples))
+    done = 0
+    while done < n_resamples:
+        rounds = min(block_rounds, n_resamples - done)
+        indices = rng.integers(0, n_samples, size=(rounds, n_samples), dtype=index_dtype)
+        for row, difference in enumerate(differences):
+            means[row, done:done + rounds] = difference[indices].mean(axis=1)
+        done += rounds
+    return means
+
+def _grouped_bootstrap_means(differences, n_resamples, rng, n_groups):
+    # Rows are sorted into n_groups equal groups.  How many resampled rows
+    # land in each group is exactly multinomial, and the sum of a group's
+    # share is drawn from its normal limit (mean and variance of the group),
+    # which is accurate once groups hold a few hundred rows.
+    n_samples = differences.shape[1]
+    order = np.argsort(differences[0], kind="mergesort")
+    starts = np.linspace(0, n_samples, n_groups + 1).astype(np.int64)[:-1]
+    sizes = np.diff(np.append(starts, n_samples))
+    counts = rng.multinomial(n_samples, sizes / float(n_samples), size=n_resamples)
+    means = np.empty((len(differences), n_resamples))
+    for row, difference in enumerate(differences):
+        ordered = difference[order]
+        group_means = np.add.reduceat(ordered, starts) / sizes
+        group_variances = np.add.reduceat(ordered ** 2, starts) / sizes - group_means ** 2
+        group_variances = np.maximum(group_variances, 0.0)
+        totals = counts @ group_means
+        spread = np.sqrt(counts @ group_variances)
+        means[row] = (totals + spread * rng.standard_normal(n_resamples)) / n_samples
+    return means
+
+REGRESSION_LOSSES = {
+    "mse": lambda errors: errors ** 2,
+    "mae": np.abs,
+}
+
+def paired_bootstrap_regression(y_true, y_pred_one, y_pred_two,
+                                n_resamples=2000, alpha=0.05, seed=None,
+                                metrics=("mse", "mae"), method="auto",
+                                n_groups=4096, max_block_elements=2 ** 22):
+    # mse and mae are means of per row losses, so a resample only needs the
+    # mean of the paired loss differences over its rows.  "exact" gathers
+    # every resample, O(n_resamples * rows); "grouped" costs
+    # O(n_resamples * n_groups); "auto" picks grouped once a gather would
+    # touch more than 2 ** 26 rows in total.
+    y_true = np.asarray(y_true, dtype=float)
+    errors_one = np.asarray(y_pred_one, dtype=float) - y_true
+    errors_two = np.asarray(y_pred_two, dtype=float) - y_true
+    differences = np.vstack([REGRESSION_LOSSES[metric](errors_one) -
+                             REGRESSION_LOSSES[metric](errors_two)
+                             for metric in metrics])
+    n_samples = len(y_true)
+    if method == "auto":
+        grouped = n_resamples * n_samples > 2 ** 26 and n_samples >= 100 * n_groups
+        method = "grouped" if grouped else "exact"
+    rng = np.random.default_rng(seed)
+    if method == "exact":
+        deltas = _exact_bootstrap_means(differences, n_resamples, rng, max_block_elements)
+    elif method == "grouped":
+        deltas = _grouped_bootstrap_means(differences, n_resamples, rng,
+                                          min(n_groups, n_samples))
+    else:
+        raise ValueError("method must be 'auto', 'exact' or 'grouped', got {}".format(method))
+    observed = differences.mean(axis=1)
+    return {metric: _bootstrap_summary(observed[row], deltas[row], alpha)
+            for row, metric in enumerate(metrics)}
@@ -1,9 +1,51 @@
 from sklearn import metrics
+import numpy as np
 import time
 from sklearn import neighbors
 from scipy import stats
 from sklearn.model_selection import cross_val_score
 from sklearn import cluster
+import joblib
+from ..prediction_cache import fingerprint
+from .. import data_sources
+
+class ApproximateKMeans():
+    def __init__(self, model, labels, confidence, sample_size):
+        self.model = model
+        self.labels_ = labels
+        self.confidence = confidence
+        self.sample_size = sample_size
+
+def occupancy_test(historical_labels, new_labels,
+                   pvalue_threshold=0.05, max_total_variation=None):
+    # compares how rows spread over the historical clusters, so the two
+    # labelings never need to be the same length or row aligned
+    historical_labels = np.asarray(historical_labels)
+    new_labels = np.asarray(new_labels)
+    clusters = np.union1d(historical_labels, new_labels)
+    historical_counts = np.bincount(np.searchsorted(clusters, historical_labels),
+                                    minlength=len(clusters))
+    new_counts = np.bincount(np.searchsorted(clusters, new_labels),
+                             minlength=len(clusters))
+    historical_occupancy = historical_counts / max(historical_counts.sum(), 1)
+    new_occupancy = new_counts / max(new_counts.sum(), 1)
+    total_variation = 0.5 * np.abs(historical_occupancy - new_occupancy).sum()
+    if len(clusters) < 2 or len(historical_labels) == 0 or len(new_labels) == 0:
+        p_value = 1.0
+    else:
+        _, p_value, _, _ = stats.chi2_contingency(
+            np.vstack([historical_counts, new_counts]))
+    similar = p_value >= pvalue_threshold
+    if max_total_variation is not None:
+        similar = similar and total_variation <= max_total_variation
+    return {
+        "similar": bool(similar),
+        "p_value": float(p_value),
+        "total_variation": float(total_variation),
+        "clusters": clusters,
+        "historical_occupancy": historical_occupancy,
+        "new_occupancy": new_occupancy,
+    }
 
 class KmeansClustering():
     def __init__(self,
@@ -13,20 +55,162 @@ class KmeansClustering():
                  target_name):
         self.column_names = column_names
         self.target_name = target_name
-        self.new_data = new_data
-        self.historical_data = historical_data
+        self.new_data = data_sources.as_data(new_data)
+        self.historical_data = data_sources.as_data(historical_data)
+        self.kmeans_cache = {}
 
     def kmeans_clusters(self, n_clusters, data):
         k_means = cluster.KMeans(n_clusters=n_clusters)
         k_means.fit(data)
         return k_means.predict(data)
 
+    def _kmeans_data(self, dataset):
+        if dataset == "new":
+            return self.new_data[self.column_names]
+        return self.historical_data[self.column_names]
+
+    def fit_kmeans(self, dataset, n_clusters):
+        # each (dataset, k) is fit once, every metric scores the cached labels
+        key = (dataset, n_clusters)
+        if key not in self.kmeans_cache:
+            k_means = cluster.KMeans(n_clusters=n_clusters)
+            k_means.fit(self._kmeans_data(dataset))
+            self.kmeans_cache[key] = k_means
+        return self.kmeans_cache[key]
+
+    def cached_kmeans_clusters(self, dataset, n_clusters):
+        return self.fit_kmeans(dataset, n_clusters).labels_
+
+    def clear_kmeans_cache(self, dataset=None):
+        self.kmeans_cache = {key: k_means
+                             for key, k_means in self.kmeans_cache.items()
+                             if dataset is not None and key[0] != dataset}
+
+    def save_historical_kmeans(self, path):
+        for k in range(2, 12):
+            self.fit_kmeans("historical", k)
+        joblib.dump({
+            "fingerprint": fingerprint(self._kmeans_data("historical")),
+            "column_names": list(self.column_names),
+            "models": {key[1]: k_means
+                       for key, k_means in self.kmeans_cache.items()
+                       if key[0] == "historical" and len(key) == 2},
+        }, path)
+
+    def load_historical_kmeans(self, path):
+        saved = joblib.load(path)
+        if list(saved["column_names"]) != list(self.column_names):
+            raise ValueError("saved clusters were fit on columns {}, not {}".format(
+                saved["column_names"], self.column_names))
+        if (self.historical_data is not None and
+                saved["fingerprint"] != fingerprint(self._kmeans_data("historical"))):
+            raise ValueError("saved clusters were fit on different historical data")
+        for n_clusters, k_means in saved["models"].items():
+            self.kmeans_cache[("historical", n_clusters)] = k_means
+
+    def _stratified_sample(self, data, sample_budget, rng):
+        if len(data) <= sample_budget:
+            return np.arange(len(data))
+        if self.target_name not in data.columns:
+            return np.sort(rng.choice(len(data), sample_budget, replace=False))
+        # keep each target value's share of the rows in the sample
+        strata = data[self.target_name].values
+        sample = []
+        for stratum in np.unique(strata):
+            members = np.flatnonzero(strata == stratum)
+            size = max(1, int(round(sample_budget * len(members) / float(len(data)))))
+            sample.append(rng.choice(members, min(size, len(members)), replace=False))
+        return np.sort(np.concatenate(sample))
+
+    def _minibatch_kmeans(self, X, n_clusters, batch_size, random_state):
+        k_means = cluster.MiniBatchKMeans(n_clusters=n_clusters,
+                                          batch_size=batch_size,
+                                          random_state=random_state,
+                                          n_init=3)
+        return k_means.fit(X)
+
+    def fit_scalable_kmeans(self, dataset, n_clusters,
+                            sample_budget=100000, batch_size=1024,
+                            random_state=None):
+        key = (dataset, n_clusters, "minibatch", sample_budget)
+        if key in self.kmeans_cache:
+            return self.kmeans_cache[key]
+        rng = np.random.RandomState(random_state)
+        data = self.new_data if dataset == "new" else self.historical_data
+        X = data[self.column_names].values
+        sample = self._stratified_sample(data, sample_budget, rng)
+        k_means = self._minibatch_kmeans(X[sample], n_clusters,
+                                         batch_size, rng.randint(2**31 - 1))
+        # everything outside the sample gets its nearest centroid
+        labels = metrics.pairwise_distances_argmin(X, k_means.cluster_centers_)
+        # confidence is the agreement between this fit and one made on an
+        # independent sample, scored on the rows of the first sample
+        check_sample = self._stratified_sample(data, sample_budget, rng)
+        check = self._minibatch_kmeans(X[check_sample], n_clusters,
+                                       batch_size, rng.randint(2**31 - 1))
+        confidence = metrics.adjusted_rand_score(
+            labels[sample],
+            metrics.pairwise_distances_argmin(X[sample], check.cluster_centers_))
+        self.kmeans_cache[key] = ApproximateKMeans(k_means, labels,
+                                                   confidence, len(sample))
+        return self.kmeans_cache[key]
+
+    def scalable_kmeans_scorer(self, metric, min_similarity,
+                               sample_budget=100000, batch_size=1024,
+                               random_state=None, pvalue_threshold=None,
+                               max_total_variation=None):
+        # the new rows' own clustering is scored against the same rows
+        # assigned to the historical centroids, so the two snapshots may
+        # differ in length.  With pvalue_threshold or max_total_variation
+        # set, cluster occupancy has to match as well.
+        similar = True
+        confidence = 1.0
+        X_new = self._kmeans_data("new").values
+        for k in range(2, 12):
+            new_clusters = self.fit_scalable_kmeans("new", k, sample_budget,
+                                                    batch_size, random_state)
+            historical_clusters = self.fit_scalable_kmeans("historical", k, sample_budget,
+                                                           batch_size, random_state)
+            confidence = min(confidence, new_clusters.confidence,
+                             historical_clusters.confidence)
+            assigned = metrics.pairwise_distances_argmin(
+                X_new, historical_clusters.model.cluster_centers_)
+            if metric(new_clusters.labels_, assigned) < min_similarity:
+                similar = False
+                break
+            if pvalue_threshold is None and max_total_variation is None:
+                continue
+            occupancy = occupancy_test(historical_clusters.labels_, assigned,
+                                       0.0 if pvalue_threshold is None else pvalue_threshold,
+                                       max_total_variation)
+            if not occupancy["similar"]:
+                similar = False
+                break
+        return {"similar": similar, "confidence": confidence}
+
+    def assign_kmeans(self, n_clusters):
+        return self.fit_kmeans("historical", n_clusters).predict(
+            self._kmeans_data("new"))
+
+    def kmeans_occupancy_drift(self, n_clusters, pvalue_threshold=0.05,
+                               max_total_variation=None):
+        return occupancy_test(self.cached_kmeans_clusters("historical", n_clusters),
+                              self.assign_kmeans(n_clusters),
+                              pvalue_threshold, max_total_variation)
+
+    def kmeans_occupancy_scorer(self, pvalue_threshold=0.05,
+                                max_total_variation=None):
+        for k in range(2, 12):
+            drift = self.kmeans_occupancy_drift(k, pvalue_threshold,
+                                                max_total_variation)
+            if not drift["similar"]:
+                return False
+        return True
+
     def kmeans_scorer(self, metric, min_similarity):
         for k in range(2, 12):
-            new_data = self.new_data[self.column_names]
-            historical_data = self.historical_data[self.column_names]
-            new_data_clusters = self.kmeans_clusters(k, new_data)
-            historical_data_clusters = self.kmeans_clusters(k, historical_data)
+            new_data_clusters = self.cached_kmeans_clusters("new", k)
+            historical_data_clusters = self.cached_kmeans_clusters("historical", k)
             score = metric(
                 new_data_clusters, historical_data_clusters)
             if score < min_similarity:
@@ -87,69 +271,151 @@ class DBscanClustering():
                  target_name):
         self.column_names = column_names
         self.target_name = target_name
-        self.new_data = new_data
-        self.historical_data = historical_data
+        self.new_data = data_sources.as_data(new_data)
+        self.historical_data = data_sources.as_data(historical_data)
+        self.dbscan_cache = {}
 
     def dbscan_clusters(self, data):
         dbscan = cluster.DBSCAN()
         return dbscan.fit_predict(data)
-    
-    def dbscan_scorer(self, metric, min_similarity):
-        for k in range(2, 12):
-            new_data = self.new_data[self.column_names]
-            historical_data = self.historical_data[self.column_names]
-            new_data_clusters = self.dbscan_clusters(new_data)
-            historical_data_clusters = self.dbscan_clusters(historical_data)
-            score = metric(
-                new_data_clusters, historical_data_clusters)
-            if score < min_similarity:
-                return False
+
+    def neighborhood_graph(self, dataset, radius):
+        # one tree query at the widest eps of a sweep; any smaller eps
+        # reuses it, since DBSCAN ignores precomputed entries beyond eps
+        for key, graph in self.dbscan_cache.items():
+            if key[0] == "graph" and key[1] == dataset and key[2] >= radius:
+                return graph
+        data = self.new_data if dataset == "new" else self.historical_data
+        nearest_neighbors = neighbors.NearestNeighbors(radius=radius)
+        nearest_neighbors.fit(data[self.column_names])
+        graph = nearest_neighbors.radius_neighbors_graph(mode="distance")
+        self.dbscan_cache[("graph", dataset, radius)] = graph
+        return graph
+
+    def dbscan_model(self, dataset, eps=0.5, min_samples=5, radius=None):
+        key = ("model", dataset, eps, min_samples)
+        if key not in self.dbscan_cache:
+            graph = self.neighborhood_graph(dataset, max(eps, radius or eps))
+            dbscan = cluster.DBSCAN(eps=eps, min_samples=min_samples,
+                                    metric="precomputed")
+            self.dbscan_cache[key] = dbscan.fit(graph)
+        return self.dbscan_cache[key]
+
+    def fit_dbscan(self, dataset, eps=0.5, min_samples=5, radius=None):
+        return self.dbscan_model(dataset, eps, min_samples, radius).labels_
+
+    def assign_dbscan(self, eps=0.5, min_samples=5):
+        # new rows join the cluster of the nearest historical core sample
+        # within eps, anything further out is noise (-1)
+        key = ("core", eps, min_samples)
+        if key not in self.dbscan_cache:
+            dbscan = self.dbscan_model("historical", eps, min_samples)
+            core = dbscan.core_sample_indices_
+            nearest_core = None
+            if len(core) > 0:
+                core_points = self.historical_data[self.column_names].values[core]
+                nearest_core = neighbors.NearestNeighbors(n_neighbors=1).fit(core_points)
+            self.dbscan_cache[key] = (nearest_core, dbscan.labels_[core])
+        nearest_core, core_labels = self.dbscan_cache[key]
+        if nearest_core is None:
+            return np.full(len(self.new_data), -1)
+        distances, indices = nearest_core.kneighbors(self.new_data[self.column_names].values)
+        return np.where(distances[:, 0] <= eps, core_labels[indices[:, 0]], -1)
+
+    def dbscan_occupancy_drift(self, eps=0.5, min_samples=5, pvalue_threshold=0.05,
+                               max_total_variation=None):
+        return occupancy_test(self.fit_dbscan("historical", eps, min_samples),
+                              self.assign_dbscan(eps, min_samples),
+                              pvalue_threshold, max_total_variation)
+
+    def clear_dbscan_cache(self):
+        self.dbscan_cache = {}
+
+    def dbscan_scorer(self, metric, min_similarity,
+                      eps_values=None, min_samples_values=None):
+        eps_values = eps_values or [0.5]
+        min_samples_values = min_samples_values or [5]
+        radius = max(eps_values)
+        for eps in eps_values:
+            for min_samples in min_samples_values:
+                new_data_clusters = self.fit_dbscan("new", eps, min_samples, radius)
+                historical_data_clusters = self.fit_dbscan("historical", eps,
+                                                           min_samples, radius)
+                score = metric(
+                    new_data_clusters, historical_data_clusters)
+                if score < min_similarity:
+                    return False
         return True
 
-    def mutual_info_dbscan_scorer(self, min_similarity):
+    def mutual_info_dbscan_scorer(self, min_similarity,
+                                  eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.adjusted_mutual_info_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def adjusted_rand_dbscan_scorer(self, min_similarity):
+    def adjusted_rand_dbscan_scorer(self, min_similarity,
+                                    eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.adjusted_rand_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def completeness_dbscan_scorer(self, min_similarity):
+    def completeness_dbscan_scorer(self, min_similarity,
+                                   eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.completeness_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def fowlkes_mallows_dbscan_scorer(self, min_similarity):
+    def fowlkes_mallows_dbscan_scorer(self, min_similarity,
+                                      eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.fowlkes_mallows_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def homogeneity_dbscan_scorer(self, min_similarity):
+    def homogeneity_dbscan_scorer(self, min_similarity,
+                                  eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.homogeneity_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def v_measure_dbscan_scorer(self, min_similarity):
+    def v_measure_dbscan_scorer(self, min_similarity,
+                                eps_values=None, min_samples_values=None):
         return self.dbscan_scorer(
             metrics.v_measure_score,
-            min_similarity
+            min_similarity,
+            eps_values,
+            min_samples_values
         )
 
-    def unsupervised_dbscan_score_clustering(self, min_similarity):
+    def unsupervised_dbscan_score_clustering(self, min_similarity,
+                                             eps_values=None, min_samples_values=None):
         return all([
-            self.v_measure_dbscan_scorer(min_similarity),
-            self.homogeneity_dbscan_scorer(min_similarity),
-            self.fowlkes_mallows_dbscan_scorer(min_similarity),
-            self.completeness_dbscan_scorer(min_similarity),
-            self.adjusted_rand_dbscan_scorer(min_similarity),
-            self.mutual_info_dbscan_scorer(min_similarity),
+            self.v_measure_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
+            self.homogeneity_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
+            self.fowlkes_mallows_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
+            self.completeness_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
+            self.adjusted_rand_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
+            self.mutual_info_dbscan_scorer(min_similarity, eps_values,
+                                         min_samples_values),
         ])
 
 class KnnClustering():
@@ -160,22 +426,29 @@ class KnnClustering():
                  target_name):
         self.column_names = column_names
         self.target_name = target_name
-        self.new_data = new_data
-        self.historical_data = historical_data
+        self.new_data = data_sources.as_data(new_data)
+        self.historical_data = data_sources.as_data(historical_data)
+
+    def _neighbor_indices(self, data, max_k):
+        # one tree build and one query serve every k up to max_k; the
+        # neighbor lists come back sorted by distance, so the first k
+        # columns are exactly the k nearest neighbors
+        X = data[self.column_names].values
+        nearest_neighbors = neighbors.NearestNeighbors(n_neighbors=max_k).fit(X)
+        return nearest_neighbors.kneighbors(X, return_distance=False)
+
+    def _best_k(self, y, predictions):
+        k_values = sorted(predictions)
+        k_measures = [metrics.mean_squared_error(y, predictions[k])
+                      for k in k_values]
+        return k_values[int(np.argmin(k_measures))]
 
     def reg_supervised_clustering(self, data):
-        k_measures = []
-        X = data[self.column_names]
-        y = data[self.target_name]
-        for k in range(2, 12):
-            knn = neighbors.KNeighborsRegressor(n_neighbors=k)
-            knn.fit(X, y)
-            y_pred = knn.predict(X)
-            k_measures.append((k, metrics.mean_squared_error(y, y_pred)))
-        sorted_k_measures = sorted(k_measures, key=lambda t:t[1])
-        lowest_mse = sorted_k_measures[0]
-        best_k = lowest_mse[0]
-        return best_k
+        y = data[self.target_name].values
+        indices = self._neighbor_indices(data, 11)
+        running_sums = np.cumsum(y[indices], axis=1)
+        predictions = {k: running_sums[:, k - 1] / k for k in range(2, 12)}
+        return self._best_k(y, predictions)
 
     def reg_supervised_similar_clustering(self, absolute_distance):
         historical_k = self.reg_supervised_clustering(self.historical_data)
@@ -186,18 +459,20 @@ class KnnClustering():
             return True
 
     def cls_supervised_clustering(self, data):
-        k_measures = []
-        X = data[self.column_names]
-        y = data[self.target_name]
-        for k in range(2, 12):
-            knn = neighbors.KNeighborsClassifier(n_neighbors=k)
-            knn.fit(X, y)
-            y_pred = knn.predict(X)
-            k_measures.append((k, metrics.mean_squared_error(y, y_pred)))
-        sorted_k_measures = sorted(k_measures, key=lambda t:t[1])
-        lowest_mse = sorted_k_measures[0]
-        best_k = lowest_mse[0]
-        return best_k
+        y = data[self.target_name].values
+        classes, codes = np.unique(y, return_inverse=True)
+        indices = self._neighbor_indices(data, 11)
+        neighbor_codes = codes[indices]
+        rows = np.arange(len(y))
+        votes = np.zeros((len(y), len(classes)), dtype=np.int64)
+        predictions = {}
+        for k in range(1, 12):
+            votes[rows, neighbor_codes[:, k - 1]] += 1
+            if k >= 2:
+                # argmax breaks ties toward the smallest class, as
+                # KNeighborsClassifier does
+                predictions[k] = classes[votes.argmax(axis=1)]
+        return self._best_k(y, predictions)
 
     def cls_supervised_similar_clustering(self, absolute_distance):
         historical_k = self.cls_supervised_clustering(self.historical_data)
@@ -217,6 +492,8 @@ class StructuralData(KnnClustering,
                  target_name):
         self.column_names = column_names
         self.target_name = target_name
-        self.new_data = new_data
-        self.historical_data = historical_data
+        self.new_data = data_sources.as_data(new_data)
+        self.historical_data = data_sources.as_data(historical_data)
+        self.kmeans_cache = {}
+        self.dbscan_cache = {}
 
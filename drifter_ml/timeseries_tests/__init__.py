@@ -0,0 +1,6 @@
+from .timeseries_tests import TimeSeriesData
+from .timeseries_tests import BucketStatistics, WindowAggregate
+from .change_point import CUSUM, PageHinkley, ADWIN, benchmark_detectors
+
+__all__ = ["TimeSeriesData", "BucketStatistics", "WindowAggregate",
+           "CUSUM", "PageHinkley", "ADWIN", "benchmark_detectors"]
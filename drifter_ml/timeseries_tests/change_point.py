@@ -0,0 +1,385 @@
+import math
+import time
+import numpy as np
+
+# Streaming change point detectors.  All of them share one API:
+#
+#   update(value)         -> True if drift was flagged at this observation
+#   update_batch(values)  -> positions in values at which drift was flagged
+#
+# update_batch processes a numpy array in vectorized chunks and gives the
+# same answers as calling update on every element in turn.
+
+def _lindley(start, increments):
+    # S_t = max(0, S_{t-1} + z_t) for a whole array at once: with C the
+    # running sum of z, S_t = C_t - min(-S_0, min_{j <= t} C_j)
+    running = np.cumsum(increments)
+    return running - np.minimum(-start, np.minimum.accumulate(running))
+
+class ChangePointDetector():
+    # update_batch starts with small chunks and doubles them while no drift
+    # shows up, so that a detection only wastes work on a short chunk
+    min_chunk_size = 1024
+    chunk_size = 65536
+
+    def __init__(self):
+        self.n_detections = 0
+        self.drift_detected = False
+
+    def update(self, value):
+        raise NotImplementedError
+
+    def _scan(self, chunk):
+        # returns the position of the first drift in chunk, or None, and
+        # leaves the state as of that position (or the end of the chunk)
+        raise NotImplementedError
+
+    def update_batch(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        detections = []
+        position = 0
+        chunk_size = self.min_chunk_size
+        while position < len(values):
+            chunk = values[position:position + chunk_size]
+            hit = self._scan(chunk)
+            if hit is None:
+                position += len(chunk)
+                self.drift_detected = False
+                chunk_size = min(2 * chunk_size, self.chunk_size)
+                continue
+            chunk_size = self.min_chunk_size
+            detections.append(position + hit)
+            self.n_detections += 1
+            self.drift_detected = True
+            position += hit + 1
+        return np.asarray(detections, dtype=np.int64)
+
+class CUSUM(ChangePointDetector):
+    # Two sided tabular CUSUM on standardized values.  When mean and std
+    # aren't given they are estimated from the first warmup observations,
+    # and estimated again after every detection.
+    def __init__(self, mean=None, std=None, k=0.5, h=5.0, warmup=30):
+        super().__init__()
+        self.k = k
+        self.h = h
+        self.warmup = warmup
+        self.fixed_mean = mean
+        self.fixed_std = std
+        self.reset()
+
+    def reset(self):
+        self.mean = self.fixed_mean
+        self.std = self.fixed_std
+        self.upper = 0.0
+        self.lower = 0.0
+        # warmup sufficient statistics
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+    def _ready(self):
+        return self.mean is not None and self.std is not None
+
+    def _finish_warmup(self):
+        mean = self.total / self.count
+        if self.mean is None:
+            self.mean = mean
+        if self.std is None:
+            variance = max(self.squares / self.count - mean * mean, 0.0)
+            self.std = math.sqrt(variance) or 1.0
+
+    def update(self, value):
+        if not self._ready():
+            self.count += 1
+            self.total += value
+            self.squares += value * value
+            if self.count >= self.warmup:
+                self._finish_warmup()
+            self.drift_detected = False
+            return False
+        z = (value - self.mean) / self.std
+        self.upper = max(0.0, self.upper + z - self.k)
+        self.lower = max(0.0, self.lower - z - self.k)
+        self.drift_detected = self.upper > self.h or self.lower > self.h
+        if self.drift_detected:
+            self.n_detections += 1
+            self.reset()
+        return self.drift_detected
+
+    def _scan(self, chunk):
+        offset = 0
+        if not self._ready():
+            needed = self.warmup - self.count
+            head = chunk[:needed]
+            self.count += len(head)
+            self.total += float(head.sum())
+            self.squares += float(np.dot(head, head))
+            if self.count < self.warmup:
+                return None
+            self._finish_warmup()
+            offset = len(head)
+            chunk = chunk[offset:]
+            if len(chunk) == 0:
+                return None
+        z = (chunk - self.mean) / self.std
+        upper = _lindley(self.upper, z - self.k)
+        lower = _lindley(self.lower, -z - self.k)
+        hits = np.flatnonzero((upper > self.h) | (lower > self.h))
+        if len(hits) == 0:
+            self.upper = float(upper[-1])
+            self.lower = float(lower[-1])
+            return None
+        self.reset()
+        return offset + int(hits[0])
+
+class PageHinkley(ChangePointDetector):
+    # Page-Hinkley test against the running mean, for increases ("up"),
+    # decreases ("down") or both.
+    def __init__(self, delta=0.005, threshold=50.0, min_instances=30, direction="both"):
+        super().__init__()
+        if direction not in ("up", "down", "both"):
+            raise ValueError("direction must be 'up', 'down' or 'both', got {}".format(direction))
+        self.delta = delta
+        self.threshold = threshold
+        self.min_instances = min_instances
+        self.direction = direction
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.upper = 0.0
+        self.upper_min = 0.0
+        self.lower = 0.0
+        self.lower_max = 0.0
+
+    def _flag(self, up_statistic, down_statistic):
+        if self.direction == "up":
+            return up_statistic > self.threshold
+        if self.direction == "down":
+            return down_statistic > self.threshold
+        return (up_statistic > self.threshold) | (down_statistic > self.threshold)
+
+    def update(self, value):
+        self.count += 1
+        self.total += value
+        mean = self.total / self.count
+        self.upper += value - mean - self.delta
+        self.upper_min = min(self.upper_min, self.upper)
+        self.lower += value - mean + self.delta
+        self.lower_max = max(self.lower_max, self.lower)
+        self.drift_detected = bool(self.count >= self.min_instances and
+                                   self._flag(self.upper - self.upper_min,
+                                              self.lower_max - self.lower))
+        if self.drift_detected:
+            self.n_detections += 1
+            self.reset()
+        return self.drift_detected
+
+    def _scan(self, chunk):
+        counts = self.count + np.arange(1, len(chunk) + 1)
+        means = (self.total + np.cumsum(chunk)) / counts
+        upper = self.upper + np.cumsum(chunk - means - self.delta)
+        upper_min = np.minimum(self.upper_min, np.minimum.accumulate(upper))
+        lower = self.lower + np.cumsum(chunk - means + self.delta)
+        lower_max = np.maximum(self.lower_max, np.maximum.accumulate(lower))
+        flagged = self._flag(upper - upper_min, lower_max - lower)
+        hits = np.flatnonzero(flagged & (counts >= self.min_instances))
+        if len(hits) == 0:
+            self.count = int(counts[-1])
+            self.total = float(means[-1] * counts[-1])
+            self.upper = float(upper[-1])
+            self.upper_min = float(upper_min[-1])
+            self.lower = float(lower[-1])
+            self.lower_max = float(lower_max[-1])
+            return None
+        self.reset()
+        return int(hits[0])
+
+class ADWIN(ChangePointDetector):
+    # ADaptive WINdowing over an exponential histogram kept in one
+    # preallocated (3, capacity) array of bucket size, total and sum of
+    # squared deviations, oldest first.  The smallest buckets hold `clock`
+    # observations and a cut is looked for once every `check_interval`
+    # buckets, so drift is reported at most clock * check_interval
+    # observations late; every check scans all split points in one
+    # vectorized pass.  Raising check_interval trades that delay for
+    # throughput.
+    def __init__(self, delta=0.002, clock=32, max_buckets=5, min_window_length=5,
+                 check_interval=1):
+        super().__init__()
+        self.delta = delta
+        self.clock = clock
+        self.check_interval = check_interval
+        self.n_inserted = 0
+        self.max_buckets = max_buckets
+        self.min_window_length = min_window_length
+        self.buckets = np.zeros((3, 64))
+        self.n_buckets = 0
+        # buckets per level, level 0 being the newest and smallest
+        self.level_counts = [0]
+        self.pending = np.empty(clock)
+        self.n_pending = 0
+
+    @property
+    def width(self):
+        return float(self.buckets[0, :self.n_buckets].sum()) + self.n_pending
+
+    @property
+    def estimation(self):
+        width = self.width
+        if width == 0:
+            return 0.0
+        return (float(self.buckets[1, :self.n_buckets].sum()) +
+                float(self.pending[:self.n_pending].sum())) / width
+
+    def update(self, value):
+        if self._push(value):
+            self.n_detections += 1
+        return self.drift_detected
+
+    def _push(self, value):
+        self.pending[self.n_pending] = value
+        self.n_pending += 1
+        self.drift_detected = False
+        if self.n_pending == self.clock:
+            self.n_pending = 0
+            block = self.pending
+            mean = float(block.mean())
+            self._insert(float(len(block)), mean * len(block),
+                         float(((block - mean) ** 2).sum()))
+        return self.drift_detected
+
+    def _scan(self, chunk):
+        # fill up the pending block, then insert whole blocks
+        position = 0
+        if self.n_pending > 0:
+            take = min(self.clock - self.n_pending, len(chunk))
+            for value in chunk[:take]:
+                if self._push(value):
+                    return position
+                position += 1
+        n_blocks = (len(chunk) - position) // self.clock
+        if n_blocks > 0:
+            blocks = chunk[position:position + n_blocks * self.clock].reshape(n_blocks, self.clock)
+            means = blocks.mean(axis=1)
+            deviations = ((blocks - means[:, np.newaxis]) ** 2).sum(axis=1)
+            totals = (means * self.clock).tolist()
+            deviations = deviations.tolist()
+            size = float(self.clock)
+            for index in range(n_blocks):
+                self._insert(size, totals[index], deviations[index])
+                if self.drift_detected:
+                    return position + (index + 1) * self.clock - 1
+            position += n_blocks * self.clock
+        for value in chunk[position:]:
+            if self._push(value):
+                return position
+            position += 1
+        return None
+
+    def _insert(self, size, total, deviation):
+        if self.n_buckets == self.buckets.shape[1]:
+            self.buckets = np.concatenate([self.buckets, np.zeros_like(self.buckets)], axis=1)
+        self.buckets[:, self.n_buckets] = (size, total, deviation)
+        self.n_buckets += 1
+        self.level_counts[0] += 1
+        self._compress()
+        self.n_inserted += 1
+        self.drift_detected = (self.n_inserted % self.check_interval == 0 and
+                               self._shrink())
+
+    def _compress(self):
+        buckets = self.buckets
+        level_counts = self.level_counts
+        level = 0
+        while level_counts[level] > self.max_buckets:
+            # buckets of a level are contiguous, merge its two oldest into
+            # the newest bucket of the next level
+            first = self.n_buckets - sum(level_counts[:level + 1])
+            size_one, size_two = buckets[0, first], buckets[0, first + 1]
+            total_one, total_two = buckets[1, first], buckets[1, first + 1]
+            size = size_one + size_two
+            delta = total_two / size_two - total_one / size_one
+            buckets[2, first] += buckets[2, first + 1] + delta * delta * size_one * size_two / size
+            buckets[1, first] = total_one + total_two
+            buckets[0, first] = size
+            buckets[:, first + 1:self.n_buckets - 1] = buckets[:, first + 2:self.n_buckets]
+            self.n_buckets -= 1
+            level_counts[level] -= 2
+            if level + 1 == len(level_counts):
+                level_counts.append(0)
+            level_counts[level + 1] += 1
+            level += 1
+
+    def _find_cut(self):
+        if self.n_buckets < 2:
+            return False
+        buckets = self.buckets[:, :self.n_buckets]
+        cumulative = buckets[:2].cumsum(axis=1)
+        width = float(cumulative[0, -1])
+        total = float(cumulative[1, -1])
+        # splits between older buckets [0, i] and newer (i, end] leaving at
+        # least min_window_length observations on each side
+        n_old = cumulative[0, :-1]
+        lower, upper = n_old.searchsorted([self.min_window_length,
+                                           width - self.min_window_length + 0.5])
+        if lower >= upper:
+            return False
+        n_old = n_old[lower:upper]
+        n_new = width - n_old
+        total_old = cumulative[1, lower:upper]
+        variance = (float((buckets[2] + buckets[1] * buckets[1] / buckets[0]).sum()) -
+                    total * total / width) / width
+        log_term = math.log(2 * math.log(width) / self.delta)
+        shift = 1 - self.min_window_length
+        m = 1.0 / (n_old + shift) + 1.0 / (n_new + shift)
+        epsilon = np.sqrt(m * (2 * variance * log_term)) + m * (2.0 / 3.0 * log_term)
+        gap = np.abs(total_old / n_old - (total - total_old) / n_new)
+        return bool((gap > epsilon).any())
+
+    def _shrink(self):
+        # drop the oldest bucket for as long as some split still shows a
+        # change in mean
+        detected = False
+        while self._find_cut():
+            detected = True
+            self.buckets[:, :self.n_buckets - 1] = self.buckets[:, 1:self.n_buckets]
+            self.n_buckets -= 1
+            level = len(self.level_counts) - 1
+            while self.level_counts[level] == 0:
+                level -= 1
+            self.level_counts[level] -= 1
+        return detected
+
+DETECTORS = {
+    "cusum": CUSUM,
+    "page_hinkley": PageHinkley,
+    "adwin": ADWIN,
+}
+
+def detector_throughput(detector, values, batch_size=100000):
+    # events per second pushed through update_batch
+    values = np.asarray(values, dtype=float)
+    start = time.perf_counter()
+    for position in range(0, len(values), batch_size):
+        detector.update_batch(values[position:position + batch_size])
+    return len(values) / (time.perf_counter() - start)
+
+# detector settings benchmark_detectors runs with, where they differ from
+# the defaults
+BENCHMARK_PARAMS = {
+    "adwin": {"check_interval": 8},
+}
+
+def benchmark_detectors(n_events=1000000, batch_size=100000, seed=None,
+                        params=None):
+    # a stream with one shift in mean half way through
+    if params is None:
+        params = BENCHMARK_PARAMS
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0, 1, size=n_events)
+    values[n_events // 2:] += 1
+    return {name: detector_throughput(detector(**params.get(name, {})),
+                                      values, batch_size)
+            for name, detector in DETECTORS.items()}
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from .. import data_sources
+
+def _as_time(values):
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.int64), False
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").view(np.int64), True
+
+def _as_width(width, is_datetime):
+    if is_datetime:
+        width = int(pd.Timedelta(width).value)
+    elif isinstance(width, (int, np.integer)) and not isinstance(width, bool):
+        width = int(width)
+    else:
+        raise ValueError("numeric timestamps need an integer width in their own unit, "
+                         "got {!r}".format(width))
+    if width <= 0:
+        raise ValueError("widths must be positive, got {!r}".format(width))
+    return width
+
+class BucketStatistics():
+    # per bucket count, shifted sum and sum of squares, and a histogram over
+    # fixed edges; every window statistic is a sum of these
+    def __init__(self, bucket_ids, values, n_buckets, edges):
+        finite = np.isfinite(values)
+        bucket_ids = bucket_ids[finite]
+        values = values[finite]
+        self.edges = edges
+        # sums are taken around the column mean so that evicting buckets
+        # doesn't lose precision to cancellation
+        self.shift = float(values.mean()) if len(values) else 0.0
+        shifted = values - self.shift
+        self.counts = np.bincount(bucket_ids, minlength=n_buckets).astype(np.int64)
+        self.sums = np.bincount(bucket_ids, weights=shifted, minlength=n_buckets)
+        self.squares = np.bincount(bucket_ids, weights=shifted * shifted, minlength=n_buckets)
+        n_bins = len(edges) + 1
+        bins = np.searchsorted(edges, values, side="right")
+        self.histograms = np.bincount(bucket_ids * n_bins + bins,
+                                      minlength=n_buckets * n_bins).reshape(n_buckets, n_bins)
+
+class WindowAggregate():
+    def __init__(self, statistics):
+        self.statistics = statistics
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.histogram = np.zeros(statistics.histograms.shape[1], dtype=np.int64)
+
+    def add(self, start, stop):
+        # buckets [start, stop) enter the window
+        statistics = self.statistics
+        self.count += int(statistics.counts[start:stop].sum())
+        self.total += statistics.sums[start:stop].sum()
+        self.squares += statistics.squares[start:stop].sum()
+        self.histogram += statistics.histograms[start:stop].sum(axis=0)
+        return self
+
+    def evict(self, start, stop):
+        # buckets [start, stop) leave the window
+        statistics = self.statistics
+        self.count -= int(statistics.counts[start:stop].sum())
+        self.total -= statistics.sums[start:stop].sum()
+        self.squares -= statistics.squares[start:stop].sum()
+        self.histogram -= statistics.histograms[start:stop].sum(axis=0)
+        return self
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return np.nan
+        return self.statistics.shift + self.total / self.count
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return np.nan
+        shifted_mean = self.total / self.count
+        return float(np.sqrt(max(self.squares / self.count - shifted_mean ** 2, 0.0)))
+
+    def cdf_at_edges(self):
+        return np.cumsum(self.histogram)[:-1] / float(max(self.count, 1))
+
+def _slide(aggregate, start, stop, next_start, next_stop):
+    if next_start >= stop:
+        # jumped past the old window, nothing carries over
+        aggregate.evict(start, stop)
+        aggregate.add(next_start, next_stop)
+    else:
+        aggregate.evict(start, next_start)
+        aggregate.add(stop, next_stop)
+
+# Drift checks over time windows.  Rows are indexed by time once (a stable
+# sort plus searchsorted for range lookups) and summarized per bucket, so
+# every window is assembled from bucket aggregates: sliding a window adds
+# the buckets that enter it and evicts the ones that leave, and the cost
+# of evaluating windows depends on the number of buckets, not rows.
+class TimeSeriesData():
+    def __init__(self, data, timestamp_column, column_names,
+                 bucket=None, n_bins=128):
+        data = data_sources.as_data(data)
+        self.data = data
+        self.timestamp_column = timestamp_column
+        self.column_names = column_names
+        times, self.is_datetime = _as_time(data[timestamp_column])
+        self.order = np.argsort(times, kind="mergesort")
+        self.times = times[self.order]
+        if bucket is None:
+            if not self.is_datetime:
+                raise ValueError("numeric timestamps need an explicit bucket width "
+                                 "in their own unit")
+            bucket = "1h"
+        self.bucket_width = _as_width(bucket, self.is_datetime)
+        self.origin = (self.times[0] // self.bucket_width) * self.bucket_width
+        self.bucket_ids = (times - self.origin) // self.bucket_width
+        self.n_buckets = int(self.bucket_ids.max()) + 1
+        self.n_bins = n_bins
+        self._statistics = {}
+
+    def _time_value(self, time):
+        if self.is_datetime:
+            return pd.Timestamp(time).value
+        return time
+
+    def _bucket_time(self, bucket):
+        time = self.origin + bucket * self.bucket_width
+        if self.is_datetime:
+            return pd.Timestamp(time)
+        return time
+
+    def window_rows(self, start, end):
+        # rows with start <= time < end, found by binary search
+        lower = np.searchsorted(self.times, self._time_value(start), side="left")
+        upper = np.searchsorted(self.times, self._time_value(end), side="left")
+        frame = self.data
+        if not hasattr(frame, "iloc"):
+            frame = frame[[self.timestamp_column] + list(self.column_names)]
+        return frame.iloc[self.order[lower:upper]]
+
+    def bucket_statistics(self, column):
+        if column not in self._statistics:
+            values = np.asarray(self.data[column], dtype=float)
+            finite = values[np.isfinite(values)]
+            edges = np.unique(np.quantile(finite, np.linspace(0, 1, self.n_bins + 1)[1:-1]))
+            self._statistics[column] = BucketStatistics(self.bucket_ids, values,
+                                                        self.n_buckets, edges)
+        return self._statistics[column]
+
+    def _in_buckets(self, width):
+        buckets, remainder = divmod(_as_width(width, self.is_datetime), self.bucket_width)
+        if remainder != 0 or buckets < 1:
+            raise ValueError("window widths must be whole multiples of the bucket width")
+        return int(buckets)
+
+    def sliding_drift(self, column, window, reference, step=None,
+                      tolerance=2, pvalue_threshold=0.05):
+        # compares each window to the reference span right before it, e.g.
+        # window="1h", reference="30D" for this hour against the trailing
+        # 30 days
+        window_buckets = self._in_buckets(window)
+        reference_buckets = self._in_buckets(reference)
+        step_buckets = 1 if step is None else self._in_buckets(step)
+        statistics = self.bucket_statistics(column)
+        current = WindowAggregate(statistics)
+        history = WindowAggregate(statistics)
+        rows = []
+        # window [end - window, end) against [end - window - reference, end - window)
+        end = window_buckets + reference_buckets
+        current.add(end - window_buckets, end)
+        history.add(0, end - window_buckets)
+        while end <= self.n_buckets:
+            rows.append(self._compare(end, current, history, tolerance, pvalue_threshold))
+            next_end = end + step_buckets
+            if next_end > self.n_buckets:
+                break
+            _slide(current, end - window_buckets, end,
+                   next_end - window_buckets, next_end)
+            _slide(history, end - window_buckets - reference_buckets, end - window_buckets,
+                   next_end - window_buckets - reference_buckets, next_end - window_buckets)
+            end = next_end
+        return pd.DataFrame(rows).set_index("window_end") if rows else pd.DataFrame()
+
+    def tumbling_drift(self, column, window, reference, tolerance=2, pvalue_threshold=0.05):
+        return self.sliding_drift(column, window, reference, step=window,
+                                  tolerance=tolerance, pvalue_threshold=pvalue_threshold)
+
+    def _compare(self, end, current, history, tolerance, pvalue_threshold):
+        mean_similar = True
+        ks_statistic = np.nan
+        p_value = np.nan
+        if current.count > 0 and history.count > 0:
+            lower = history.mean - history.std * tolerance
+            upper = history.mean + history.std * tolerance
+            mean_similar = lower <= current.mean <= upper
+            ks_statistic = float(np.max(np.abs(current.cdf_at_edges() -
+                                               history.cdf_at_edges()), initial=0.0))
+            effective_size = np.sqrt(current.count * history.count /
+                                     float(current.count + history.count))
+            p_value = float(stats.kstwobign.sf(effective_size * ks_statistic))
+        return {
+            "window_end": self._bucket_time(end),
+            "count": current.count,
+            "mean": current.mean,
+            "reference_count": history.count,
+            "reference_mean": history.mean,
+            "reference_std": history.std,
+            "mean_similar": bool(mean_similar),
+            "ks_statistic": ks_statistic,
+            "ks_pvalue": p_value,
+            "distribution_similar": bool(np.isnan(p_value) or p_value >= pvalue_threshold),
+        }
@@ -25,7 +25,9 @@ setup(
         "Programming Language :: Python :: 3.7",
     ],
     packages=["drifter_ml", 'drifter_ml.classification_tests', 'drifter_ml.columnar_tests',
-              'drifter_ml.regression_tests', 'drifter_ml.structural_tests'],
+              'drifter_ml.regression_tests', 'drifter_ml.structural_tests',
+              'drifter_ml.timeseries_tests'],
     include_package_data=True,
-    install_requires=["sklearn", "scipy", "numpy", "statsmodels", "mlxtend", "pytest"],
+    install_requires=["sklearn", "scipy", "numpy", "statsmodels", "pytest", "joblib"],
+    extras_require={"arrow": ["pyarrow"]},
 )
@@ -1,9 +1,19 @@
+from functools import partial
 from drifter_ml import classification_tests
+from drifter_ml import ExecutionConfig
+from drifter_ml import ModelComparison
+from drifter_ml import significance
 from sklearn import tree
 from sklearn import ensemble
 from sklearn import model_selection
+from sklearn import metrics
+from sklearn import compose
+from sklearn import linear_model
+from sklearn import pipeline
+from sklearn import preprocessing
 import numpy as np
 import pandas as pd
+import pytest
 
 def generate_binary_classification_data_and_models():
     df = pd.DataFrame()
@@ -59,6 +69,232 @@ def generate_multiclass_classification_data_and_models():
     clf2.fit(X, df[target_name])
     return df, column_names, target_name, clf1, clf2
 
+class CountingClassifier(tree.DecisionTreeClassifier):
+    fit_calls = 0
+    predict_calls = 0
+    predict_proba_calls = 0
+
+    def fit(self, X, y, sample_weight=None, check_input=True):
+        CountingClassifier.fit_calls += 1
+        return super().fit(X, y, sample_weight=sample_weight, check_input=check_input)
+
+    def predict(self, X, check_input=True):
+        CountingClassifier.predict_calls += 1
+        return super().predict(X, check_input=check_input)
+
+    def predict_proba(self, X, check_input=True):
+        CountingClassifier.predict_proba_calls += 1
+        return super().predict_proba(X, check_input=check_input)
+
+def generate_counting_classification_data_and_model():
+    df = pd.DataFrame({
+        "A": np.random.normal(0, 1, size=500),
+        "B": np.random.normal(0, 3, size=500),
+        "C": np.random.normal(12, 4, size=500),
+    })
+    df["target"] = (df["A"] + df["B"] + df["C"] > 12).astype(int)
+    column_names = ["A", "B", "C"]
+    target_name = "target"
+    clf = CountingClassifier(max_depth=3, random_state=0)
+    clf.fit(df[column_names], df[target_name])
+    CountingClassifier.fit_calls = 0
+    CountingClassifier.predict_calls = 0
+    CountingClassifier.predict_proba_calls = 0
+    return df, column_names, target_name, clf
+
+def test_classifier_testing_predicts_once():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    classes = list(df.target.unique())
+    test_suite.classifier_testing(
+        {klass: 0.1 for klass in classes},
+        {klass: 0.1 for klass in classes},
+        {klass: 0.1 for klass in classes}
+    )
+    test_suite.predict_proba()
+    test_suite.predict_proba()
+    assert CountingClassifier.predict_calls == 1
+    assert CountingClassifier.predict_proba_calls == 1
+
+def test_prediction_cache_invalidation():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    test_suite.predict()
+    test_suite.predict()
+    test_suite.invalidate_predictions()
+    test_suite.predict()
+    assert CountingClassifier.predict_calls == 2
+
+def test_two_model_per_class_predicts_once():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassifierComparison(clf,
+                                                           clf,
+                                                           df,
+                                                           target_name,
+                                                           column_names)
+    test_suite.precision_per_class(clf)
+    test_suite.recall_per_class(clf)
+    test_suite.f1_per_class(clf)
+    assert CountingClassifier.predict_calls == 1
+
+def test_two_model_cross_val_fits_each_model_cv_times():
+    df, column_names, target_name, clf_one = generate_counting_classification_data_and_model()
+    # three classes, so the comparison stays off the roc_auc path
+    df[target_name] += (df["C"] > 14).astype(int)
+    clf_two = CountingClassifier(max_depth=1, random_state=0)
+    test_suite = classification_tests.ClassifierComparison(clf_one,
+                                                           clf_two,
+                                                           df,
+                                                           target_name,
+                                                           column_names)
+    test_suite.cross_val_two_model_classifier_testing(cv=3)
+    test_suite.cross_val_per_class_two_model_classifier_testing(cv=3)
+    assert CountingClassifier.fit_calls == 6
+    expected = model_selection.cross_val_predict(clf_two, df[column_names],
+                                                 df[target_name], cv=3)
+    assert np.array_equal(test_suite._cross_val_predict(clf_two, 3), expected)
+    assert test_suite.cross_val_f1(clf_two, average="micro") == metrics.f1_score(
+        df[target_name], expected, average="micro")
+
+def test_cross_val_classifier_testing_fits_each_fold_once():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    test_suite.cross_val_classifier_testing(0.1, 0.1, 0.1, cv=3)
+    test_suite.spread_cross_val_recall_anomaly_detection(1, cv=3)
+    test_suite.cross_val_f1_avg(0.1, cv=3)
+    assert CountingClassifier.fit_calls == 3
+
+def test_cross_val_keeps_column_names_for_pipelines():
+    df, column_names, target_name, _ = generate_counting_classification_data_and_model()
+    clf = pipeline.Pipeline([
+        ("columns", compose.ColumnTransformer([("scale", preprocessing.StandardScaler(),
+                                                ["A", "B"])])),
+        ("model", linear_model.LogisticRegression()),
+    ])
+    clf.fit(df[column_names], df[target_name])
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    expected = model_selection.cross_val_score(clf, df[column_names],
+                                               df[target_name], cv=3,
+                                               scoring="precision")
+    assert np.allclose(test_suite.precision_cv(3), expected)
+
+def test_cross_val_scores_match_cross_validate():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    expected = model_selection.cross_val_score(clf, df[column_names],
+                                               df[target_name], cv=3,
+                                               scoring="f1")
+    assert np.allclose(test_suite.f1_cv(3), expected)
+
+def test_cross_val_does_not_share_folds_between_long_split_lists():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    df = pd.concat([df] * 10, ignore_index=True)
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    first = list(model_selection.KFold(3).split(df))
+    # same ends, different middles: the printed arrays are identical
+    second = []
+    for train, test in first:
+        train, test = train.copy(), test.copy()
+        train[100:400], test[100:400] = test[100:400].copy(), train[100:400].copy()
+        second.append((train, test))
+    assert repr(first) == repr(second)
+    for splits in [first, second]:
+        expected = model_selection.cross_val_score(clf, df[column_names],
+                                                   df[target_name], cv=splits,
+                                                   scoring="f1")
+        assert np.allclose(test_suite.f1_cv(splits), expected)
+
+def test_numeric_folds_are_taken_from_one_contiguous_array():
+    df, column_names, target_name, _ = generate_counting_classification_data_and_model()
+    df.index = df.index * 7 + 3
+    test_suite = classification_tests.ClassificationTests(tree.DecisionTreeClassifier(),
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    engine = test_suite.cross_validation_engine
+    X, y = engine.fold_arrays()
+    assert isinstance(X, np.ndarray) and X.flags["C_CONTIGUOUS"]
+    assert np.array_equal(X, df[column_names].to_numpy())
+    assert isinstance(y, np.ndarray)
+    assert engine.fold_arrays()[0] is X
+    assert test_suite._X is None
+    per_class = test_suite._per_class_cross_val("recall", 3)
+    for fold, scores in zip(engine.fold_results(model_selection.KFold(3, shuffle=True,
+                                                                      random_state=42)),
+                            per_class):
+        assert isinstance(fold.y_true, np.ndarray)
+        assert np.array_equal(fold.y_true, y[fold.test_index])
+        for klass, score in scores.items():
+            expected = metrics.recall_score(fold.y_true == klass, fold.y_pred == klass,
+                                            zero_division=0)
+            assert np.isclose(score, expected)
+
+def test_folds_keep_the_frame_for_estimators_fit_on_column_names():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    X, _ = test_suite.cross_validation_engine.fold_arrays()
+    assert list(X.columns) == column_names
+
+def test_per_class_metrics_match_sklearn():
+    y_true = np.random.randint(0, 6, size=2000)
+    y_pred = np.where(np.random.random(2000) < 0.7,
+                      y_true, np.random.randint(0, 7, size=2000))
+    per_class = classification_tests.per_class_metrics(y_true, y_pred)
+    labels = list(per_class.labels)
+    for metric, score in [("precision", metrics.precision_score),
+                          ("recall", metrics.recall_score),
+                          ("f1", metrics.f1_score)]:
+        expected = score(y_true, y_pred, labels=labels,
+                         average=None, zero_division=0)
+        assert np.allclose(getattr(per_class, metric), expected)
+
+def test_lower_boundary_per_class_uses_per_class_metrics():
+    df, column_names, target_name, clf = generate_counting_classification_data_and_model()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    recall = test_suite.per_class_metrics().to_dict("recall")
+    assert test_suite.recall_lower_boundary_per_class(
+        {klass: value for klass, value in recall.items()})
+    assert not test_suite.recall_lower_boundary_per_class(
+        {klass: value + 0.01 for klass, value in recall.items()})
+
+def test_parallel_cross_validation_matches_serial():
+    df, column_names, target_name, _ = generate_counting_classification_data_and_model()
+    clf = tree.DecisionTreeClassifier(max_depth=3, random_state=0)
+    serial = classification_tests.ClassificationTests(clf,
+                                                      df,
+                                                      target_name,
+                                                      column_names)
+    parallel = classification_tests.ClassificationTests(
+        clf, df, target_name, column_names,
+        execution_config=ExecutionConfig(n_jobs=2, backend="loky"))
+    assert serial.f1_cv(3) == parallel.f1_cv(3)
+    assert (serial._per_class_cross_val("recall", 3) ==
+            parallel._per_class_cross_val("recall", 3))
+
 def test_precision_recall_f1_binary():
     df, column_names, target_name, clf, _ = generate_binary_classification_data_and_models()
     test_suite = classification_tests.ClassificationTests(clf,
@@ -472,6 +708,28 @@ def test_run_time_stress_test():
     except:
         assert False
 
+def test_run_time_stress_test_report():
+    df, column_names, target_name, clf, _ = generate_binary_classification_data_and_models()
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          df,
+                                                          target_name,
+                                                          column_names)
+    performance_boundary = [
+        {"sample_size": 100, "max_run_time": 100, "max_p99": 100},
+        {"sample_size": 500, "max_p95": 100, "min_throughput": 1},
+    ]
+    report = test_suite.run_time_stress_test(performance_boundary,
+                                             warmup=2, trials=5)
+    assert report
+    assert [latency.sample_size for latency in report.latencies] == [100, 500]
+    for latency in report.latencies:
+        assert len(latency.timings_ns) == 5
+        assert latency.p50 <= latency.p95 <= latency.p99
+    failing = test_suite.run_time_stress_test([{"sample_size": 100,
+                                                "max_p95": 0}])
+    assert not failing
+    assert failing.to_dict()["failures"][0]["budget"] == "max_p95"
+
 def test_two_model_prediction_run_time_stress_test():
     df, column_names, target_name, clf1, clf2 = generate_binary_classification_data_and_models()
     test_suite = classification_tests.ClassifierComparison(clf1,
@@ -567,3 +825,83 @@ def test_cross_val_two_model_classifier_testing_multiclass():
         assert True
     except:
         assert False
+
+def test_classification_tests_from_parquet(tmpdir):
+    pytest.importorskip("pyarrow")
+    df, column_names, target_name, clf, _ = generate_binary_classification_data_and_models()
+    df["unused"] = 0.0
+    df.to_parquet(str(tmpdir.join("holdout.parquet")))
+    test_suite = classification_tests.ClassificationTests(clf,
+                                                          str(tmpdir.join("holdout.parquet")),
+                                                          target_name,
+                                                          column_names)
+    assert test_suite.X.equals(df[column_names])
+    assert "unused" not in test_suite.test_data._arrays
+    assert np.array_equal(test_suite.predict(), clf.predict(df[column_names]))
+
+def test_model_comparison_leaderboard_and_mcnemar():
+    X = np.random.normal(0, 1, size=(600, 3))
+    y = np.where(X[:, 0] + 0.5 * X[:, 1] > 0, "yes", "no")
+    df = pd.DataFrame(X, columns=["A", "B", "C"])
+    df["target"] = y
+    models = {}
+    for depth in [1, 2, 4]:
+        models["tree_{}".format(depth)] = tree.DecisionTreeClassifier(
+            max_depth=depth, random_state=0).fit(df[["A", "B", "C"]][:300], y[:300])
+    holdout = df[300:]
+    comparison = ModelComparison(models, holdout, "target", ["A", "B", "C"],
+                                 execution_config=ExecutionConfig(n_jobs=2,
+                                                                  backend="threading"))
+    table = comparison.metrics()
+    for name, model in models.items():
+        y_pred = model.predict(holdout[["A", "B", "C"]])
+        assert np.isclose(table.loc[name, "accuracy"],
+                          metrics.accuracy_score(holdout["target"], y_pred))
+        assert np.isclose(table.loc[name, "f1"],
+                          metrics.f1_score(holdout["target"], y_pred, average="macro"))
+    leaderboard = comparison.leaderboard("accuracy")
+    assert list(leaderboard["rank"]) == [1, 2, 3]
+    assert leaderboard["accuracy"].is_monotonic_decreasing
+    p_values = comparison.pairwise_significance(correction=None)
+    statistic, p_value = significance.mcnemar_test(
+        holdout["target"], comparison.predictions()[0], comparison.predictions()[2])
+    assert np.isclose(p_values.loc["tree_1", "tree_4"], p_value)
+    assert (np.diag(p_values) == 1).all()
+
+def test_paired_bootstrap_matches_resampling_rows():
+    data_rng = np.random.RandomState(0)
+    y_true = data_rng.randint(0, 3, size=400)
+    y_pred_one = np.where(data_rng.random_sample(400) < 0.8, y_true, data_rng.randint(0, 3, size=400))
+    y_pred_two = np.where(data_rng.random_sample(400) < 0.6, y_true, data_rng.randint(0, 3, size=400))
+    results = significance.paired_bootstrap_classification(y_true, y_pred_one, y_pred_two,
+                                                            n_resamples=4000, seed=0)
+    assert np.isclose(results["f1"]["difference"],
+                      metrics.f1_score(y_true, y_pred_one, average="macro") -
+                      metrics.f1_score(y_true, y_pred_two, average="macro"))
+    rng = np.random.RandomState(1)
+    deltas = []
+    for _ in range(4000):
+        rows = rng.randint(0, 400, size=400)
+        deltas.append(metrics.accuracy_score(y_true[rows], y_pred_one[rows]) -
+                      metrics.accuracy_score(y_true[rows], y_pred_two[rows]))
+    lower, upper = results["accuracy"]["confidence_interval"]
+    assert abs(lower - np.quantile(deltas, 0.025)) < 0.01
+    assert abs(upper - np.quantile(deltas, 0.975)) < 0.01
+    assert results["accuracy"]["p_value"] < 0.01
+    assert results["mcnemar"]["p_value"] < 0.01
+
+def test_paired_bootstrap_with_many_labels():
+    data_rng = np.random.RandomState(0)
+    y_true = data_rng.randint(0, 300, size=3000)
+    y_pred_one = np.where(data_rng.random_sample(3000) < 0.8, y_true, data_rng.randint(0, 300, size=3000))
+    y_pred_two = np.where(data_rng.random_sample(3000) < 0.6, y_true, data_rng.randint(0, 300, size=3000))
+    results = significance.paired_bootstrap_classification(y_true, y_pred_one, y_pred_two,
+                                                            n_resamples=500, seed=0,
+                                                            max_block_elements=2 ** 16)
+    for metric, score in [("accuracy", metrics.accuracy_score),
+                          ("f1", partial(metrics.f1_score, average="macro"))]:
+        observed = score(y_true, y_pred_one) - score(y_true, y_pred_two)
+        assert np.isclose(results[metric]["difference"], observed)
+        lower, upper = results[metric]["confidence_interval"]
+        assert lower < observed < upper
+        assert results[metric]["n_resamples"] == 500
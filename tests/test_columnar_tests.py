@@ -1,6 +1,13 @@
 from drifter_ml import columnar_tests
+from drifter_ml.columnar_tests import permutation
+from drifter_ml.columnar_tests import streaming
+from drifter_ml.columnar_tests import hyperloglog
+from drifter_ml import robust_statistics
+from drifter_ml import data_sources
+from scipy import stats
 import numpy as np
 import pandas as pd
+import pytest
 
 def generate_data():
     new_data = pd.DataFrame()
@@ -109,3 +116,251 @@ def test_mann_whitney_u_similar_distribution():
         assert True
     except:
         assert False
+
+def test_permutation_statistics_match_scipy():
+    new_data, historical_data = generate_data()
+    x = new_data["similar_normal"].values
+    y = historical_data["similar_normal"].values
+    pooled = np.concatenate([x, y])
+    expected = {
+        "ks_2samp": stats.ks_2samp(x, y).statistic,
+        "mann_whitney_u": stats.mannwhitneyu(x, y).statistic,
+        "kruskal": stats.kruskal(x, y).statistic,
+        "pearson": stats.pearsonr(x, y)[0],
+        "spearman": stats.spearmanr(x, y).correlation,
+        "wilcoxon": stats.wilcoxon(x, y).statistic,
+    }
+    for name, value in expected.items():
+        kernel = permutation.STATISTICS[name](pooled, len(x))
+        assert np.isclose(kernel.reference(), value)
+
+def test_permutation_test_many_rounds():
+    new_data, historical_data = generate_data()
+    p_value = permutation.permutation_test(new_data["different_normal"],
+                                           historical_data["different_normal"],
+                                           "ks_2samp",
+                                           num_rounds=10000,
+                                           seed=0,
+                                           max_block_elements=2 ** 20)
+    assert p_value == 1.0 / 10001
+    test_suite = columnar_tests.ColumnarData(new_data, historical_data)
+    assert not test_suite.ks_2samp_similar_distribution("different_normal",
+                                                        num_rounds=1000)
+    assert not test_suite.ks_2samp_similar_distribution("different_normal",
+                                                        method="exact")
+    assert test_suite.ks_2samp_similar_distribution("similar_normal",
+                                                    pvalue_threshold=0.0,
+                                                    method="exact")
+
+def test_historical_profile_matches_direct_computation(tmpdir):
+    new_data, historical_data = generate_data()
+    profile = columnar_tests.HistoricalProfile.from_data(historical_data)
+    column = historical_data["similar_gamma"]
+    test_suite = columnar_tests.ColumnarData(historical_data, new_data)
+    assert np.isclose(profile["similar_gamma"].mean, np.mean(column))
+    assert np.isclose(profile["similar_gamma"].std, np.std(column))
+    assert np.isclose(profile["similar_gamma"].iqr, stats.iqr(column))
+    assert np.isclose(profile["similar_gamma"].trimean, test_suite.trimean(column))
+    assert np.isclose(profile["similar_gamma"].trimean_absolute_deviation,
+                      test_suite.trimean_absolute_deviation(column))
+
+    path = str(tmpdir.join("profile.json"))
+    profile.save(path)
+    loaded = columnar_tests.HistoricalProfile.load(path)
+    test_suite = columnar_tests.ColumnarData(None, new_data,
+                                             historical_profile=loaded)
+    for column in ["similar_normal", "different_normal"]:
+        expected = columnar_tests.ColumnarData(historical_data, new_data)
+        assert test_suite.mean_similarity(column) == expected.mean_similarity(column)
+        assert test_suite.median_similarity(column) == expected.median_similarity(column)
+        assert test_suite.trimean_similarity(column) == expected.trimean_similarity(column)
+
+def test_streaming_columnar_data():
+    new_data, historical_data = generate_data()
+    columns = ["similar_normal", "different_normal"]
+    test_suite = streaming.StreamingColumnarData(historical_data, columns, seed=0)
+    chunks = [new_data.iloc[start:start + 100] for start in range(0, 1000, 100)]
+    verdicts = list(test_suite.monitor(chunks))
+    assert len(verdicts) == 10
+    assert verdicts[-1]["similar_normal"]["mean"]
+    assert not verdicts[-1]["different_normal"]["mean"]
+    assert not verdicts[-1]["different_normal"]["ks_2samp"]
+    moments = test_suite.streams["similar_normal"].moments
+    assert np.isclose(moments.mean, new_data["similar_normal"].mean())
+    assert np.isclose(moments.std, np.std(new_data["similar_normal"]))
+
+def test_streaming_ks_statistic_with_ties():
+    rng = np.random.RandomState(0)
+    historical_data = pd.DataFrame({"counts": rng.randint(0, 5, size=100000)})
+    new_data = pd.DataFrame({"counts": rng.randint(0, 5, size=10000)})
+    test_suite = streaming.StreamingColumnarData(historical_data, ["counts"], seed=0)
+    test_suite.update(new_data)
+    expected = stats.ks_2samp(historical_data["counts"], new_data["counts"]).statistic
+    assert np.isclose(test_suite.ks_statistic("counts"), expected)
+    assert test_suite.ks_2samp_similar_distribution("counts")
+    shifted = streaming.StreamingColumnarData(historical_data, ["counts"], seed=0)
+    shifted.update(new_data + 1)
+    assert not shifted.ks_2samp_similar_distribution("counts")
+
+def test_quantile_sketch_is_bounded_and_mergeable():
+    left = streaming.QuantileSketch(k=64, seed=0)
+    right = streaming.QuantileSketch(k=64, seed=1)
+    for _ in range(50):
+        left.update(np.random.normal(0, 1, size=2000))
+        right.update(np.random.normal(0, 1, size=2000))
+    left.merge(right)
+    assert left.count == 200000
+    assert len(left) < 64 * 20
+    assert abs(left.quantile(0.5)) < 0.1
+    assert abs(left.cdf(0.0) - 0.5) < 0.05
+
+def test_robust_statistics_match_reference_loop():
+    new_data, historical_data = generate_data()
+    column = historical_data["similar_gamma"]
+    q1, median, q3 = np.quantile(column, 0.25), np.median(column), np.quantile(column, 0.75)
+    expected_trimean = (q1 + 2*median + q3)/4
+    expected_tad = sum([abs(elem - expected_trimean) for elem in column])/len(column)
+    summary = robust_statistics.robust_summary(column)
+    assert np.isclose(summary["trimean"], expected_trimean)
+    assert np.isclose(summary["trimean_absolute_deviation"], expected_tad)
+    assert np.isclose(summary["iqr"], stats.iqr(column))
+    single = column.values.astype(np.float32)
+    assert np.isclose(robust_statistics.trimean_absolute_deviation(single),
+                      expected_tad, rtol=1e-4)
+
+def test_columnar_data_from_file_sources(tmpdir):
+    new_data, historical_data = generate_data()
+    records = historical_data.to_records(index=False)
+    np.save(str(tmpdir.join("historical.npy")), records)
+    source = data_sources.as_data(str(tmpdir.join("historical.npy")))
+    column = source["similar_normal"]
+    assert np.shares_memory(column.values, source.array)
+    assert np.array_equal(column.values, historical_data["similar_normal"].values)
+
+    from_arrays = columnar_tests.ColumnarData(str(tmpdir.join("historical.npy")), new_data)
+    from_frames = columnar_tests.ColumnarData(historical_data, new_data)
+    for column in ["similar_normal", "similar_gamma"]:
+        assert from_arrays.mean_similarity(column) == from_frames.mean_similarity(column)
+        assert from_arrays.trimean_similarity(column) == from_frames.trimean_similarity(column)
+
+    pytest.importorskip("pyarrow")
+    historical_data.to_parquet(str(tmpdir.join("historical.parquet")))
+    parquet = data_sources.as_data(str(tmpdir.join("historical.parquet")))
+    assert len(parquet) == len(historical_data)
+    assert parquet[["random", "similar_gamma"]].equals(historical_data[["random", "similar_gamma"]])
+    assert list(parquet._arrays) == ["random", "similar_gamma"]
+    historical_data.to_feather(str(tmpdir.join("historical.feather")))
+    arrow = data_sources.as_data(str(tmpdir.join("historical.feather")))
+    assert np.array_equal(arrow["random"].values, historical_data["random"].values)
+
+def generate_sanitization_data():
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame({
+        "normal": rng.normal(0, 1, size=1000).round(2),
+        "ids": np.arange(1000),
+        "offset_ids": np.arange(1000) + 3,
+        "small_ints": rng.randint(-3, 3, size=1000),
+        "labels": rng.choice(["a", "b", None], size=1000),
+        "flags": rng.random_sample(1000) > 0.5,
+    })
+    data.loc[::7, "normal"] = np.nan
+    return data
+
+def test_sanitization_profile_matches_pandas():
+    data = generate_sanitization_data()
+    test_suite = columnar_tests.DataSanitization(data)
+    table = test_suite.profile.table
+    assert (table["nulls"] == data.isnull().sum()).all()
+    assert (table["distinct"] == data.nunique(dropna=False)).all()
+    numeric = ["normal", "ids", "small_ints"]
+    assert np.allclose(table.loc[numeric, "min"], data[numeric].min())
+    assert np.allclose(table.loc[numeric, "max"], data[numeric].max())
+    assert (table.loc[numeric, "negative"] == (data[numeric] < 0).sum()).all()
+    assert (table.loc[numeric, "zero"] == (data[numeric] == 0).sum()).all()
+    for lower, upper in [(-1, 1), (0.5, 0.5), (2, -2), (-10, 10)]:
+        expected = ((data["normal"] >= lower) & (data["normal"] <= upper)).sum()
+        assert test_suite.profile.range_hits("normal", lower, upper) == expected
+
+def test_data_sanitization_predicates():
+    data = generate_sanitization_data()
+    test_suite = columnar_tests.DataSanitization(data)
+    assert test_suite.is_complete("ids") is True
+    assert test_suite.is_complete("normal") is False
+    assert test_suite.has_completeness("normal", 0.8)
+    assert not test_suite.has_completeness("labels", 0.8)
+    assert test_suite.is_unique("ids")
+    assert not test_suite.is_unique("small_ints")
+    assert test_suite.has_uniqueness("ids", 0.9)
+    assert test_suite.is_in_range("ids", 0, 999, 0.99)
+    assert not test_suite.is_in_range("normal", 0, 10, 0.5)
+    assert test_suite.is_non_negative("ids")
+    assert not test_suite.is_non_negative("small_ints")
+    assert test_suite.is_less_than("ids", "small_ints") is False
+    assert test_suite.is_less_than("small_ints", "offset_ids") is True
+
+def test_sanitization_profile_handles_nullable_dtypes():
+    data = pd.DataFrame({
+        "ints": pd.array([1, None, 3, -2], dtype="Int64"),
+        "floats": pd.array([1.5, None, 1.5, 0.0], dtype="Float64"),
+        "flags": pd.array([True, None, False, True], dtype="boolean"),
+        "strings": pd.array(["x", None, "y", "x"], dtype="string"),
+        "plain": [1.0, 2.0, 3.0, 4.0],
+    })
+    test_suite = columnar_tests.DataSanitization(data)
+    assert test_suite.is_complete("plain")
+    assert not test_suite.is_complete("ints")
+    table = test_suite.profile.table
+    assert (table["nulls"] == data.isnull().sum()).all()
+    assert (table["distinct"] == data.nunique(dropna=False)).all()
+    assert not test_suite.is_non_negative("ints")
+    assert test_suite.profile.range_hits("ints", 0, 5) == 2
+
+def test_sanitization_profile_sorts_range_columns_on_demand():
+    data = generate_sanitization_data()
+    test_suite = columnar_tests.DataSanitization(data)
+    test_suite.is_complete("normal")
+    assert test_suite.profile.sorted_values == {}
+    test_suite.is_in_range("normal", -1, 1, 0.5)
+    assert list(test_suite.profile.sorted_values) == ["normal"]
+
+def test_hyperloglog_is_accurate_and_mergeable():
+    values = np.array(["id{}".format(index) for index in range(50000)], dtype=object)
+    sketch = hyperloglog.HyperLogLog(precision=12).update(values)
+    lower, upper = sketch.error_bounds(0.999)
+    assert lower <= 50000 <= upper
+    assert abs(sketch.estimate() - 50000) < 4 * sketch.relative_error * 50000
+    first = hyperloglog.HyperLogLog(precision=12).update(values[:30000])
+    second = hyperloglog.HyperLogLog(precision=12).update(values[20000:])
+    assert np.array_equal(first.merge(second).registers, sketch.registers)
+    small = hyperloglog.HyperLogLog().update(np.repeat(np.arange(100), 7))
+    assert abs(small.estimate() - 100) < 2
+    with pytest.raises(ValueError):
+        sketch.merge(hyperloglog.HyperLogLog(precision=14))
+
+def test_approximate_data_sanitization():
+    data = generate_sanitization_data()
+    test_suite = columnar_tests.DataSanitization(data, approximate=True)
+    assert test_suite.is_unique("ids") is True
+    assert test_suite.is_unique("small_ints") is False
+    exact = columnar_tests.DataSanitization(data).profile.table
+    fields = ["count", "nulls", "min", "max", "negative", "zero", "positive"]
+    assert np.allclose(test_suite.profile.table[fields].astype(float),
+                       exact[fields].astype(float), equal_nan=True)
+    assert test_suite.profile.sorted_values == {}
+    assert test_suite.has_uniqueness("ids", 0.9)
+    assert not test_suite.has_uniqueness("labels", 0.1)
+    bounds = test_suite.uniqueness_bounds("normal", 0.1)
+    exact = data["normal"].nunique(dropna=False) / float(len(data))
+    assert bounds["lower"] <= exact <= bounds["upper"]
+    assert bounds["passed"] and bounds["certain"]
+    assert test_suite.is_complete("ids") and not test_suite.is_complete("labels")
+
+def test_approximate_is_unique_holds_up_to_the_sketch_error():
+    ids = np.arange(100000)
+    data = pd.DataFrame({"ids": ids, "duplicated": np.where(ids < 10000, ids + 10000, ids)})
+    test_suite = columnar_tests.DataSanitization(data, approximate=True)
+    assert test_suite.is_unique("ids") is True
+    assert test_suite.is_unique("duplicated") is False
+    bounds = test_suite.uniqueness_bounds("duplicated", 0.95)
+    assert bounds["upper"] < 1 and bounds["certain"]
+    assert columnar_tests.DataSanitization(data).is_unique("duplicated") is False
@@ -1,9 +1,14 @@
 from drifter_ml import regression_tests
+from drifter_ml import ExecutionConfig
+from drifter_ml import ModelComparison
+from drifter_ml import significance
 from sklearn import tree
 from sklearn import ensemble
 from sklearn import model_selection
 import numpy as np
 import pandas as pd
+from scipy import stats
+from sklearn import metrics
 
 def generate_regression_data_and_models():
     df = pd.DataFrame()
@@ -123,6 +128,21 @@ def test_run_time_stress_test():
     except:
         assert False
 
+def test_run_time_stress_test_curve():
+    df, column_names, target_name, reg, _ = generate_regression_data_and_models()
+    test_suite = regression_tests.RegressionTests(reg,
+                                                  df,
+                                                  target_name,
+                                                  column_names)
+    performance_boundary = [{"sample_size": size, "max_p99": 100}
+                            for size in (10, 100, 1000)]
+    report = test_suite.run_time_stress_test(performance_boundary,
+                                             trials=3, random_state=0)
+    assert report.passed
+    curve = report.to_dict()["latencies"]
+    assert [point["sample_size"] for point in curve] == [10, 100, 1000]
+    assert all(point["throughput"] > 0 for point in curve)
+
 def test_two_model_prediction_run_time_stress_test():
     df, column_names, target_name, reg1, reg2 = generate_regression_data_and_models()
     test_suite = regression_tests.RegressionComparison(reg1,
@@ -166,3 +186,96 @@ def test_two_model_regression_testing():
         assert True
     except:
         assert False
+
+def test_parallel_mse_cv_matches_serial():
+    df, column_names, target_name, _, _ = generate_regression_data_and_models()
+    reg = tree.DecisionTreeRegressor(max_depth=4, random_state=0)
+    serial = regression_tests.RegressionTests(reg,
+                                              df,
+                                              target_name,
+                                              column_names)
+    parallel = regression_tests.RegressionTests(
+        reg, df, target_name, column_names,
+        execution_config=ExecutionConfig(n_jobs=2, backend="threading"))
+    assert np.allclose(serial.mse_cv(3), parallel.mse_cv(3))
+
+def test_chunked_predictions_match_single_call():
+    df, column_names, target_name, reg, _ = generate_regression_data_and_models()
+    chunked = regression_tests.RegressionTests(
+        reg, df, target_name, column_names,
+        execution_config=ExecutionConfig(n_jobs=2, backend="threading",
+                                         chunk_size=128))
+    assert np.array_equal(chunked.predict(), reg.predict(df[column_names]))
+    assert chunked.regression_testing(10000, 10000)
+
+def test_model_comparison_paired_t_test():
+    df, column_names, target_name, reg1, reg2 = generate_regression_data_and_models()
+    comparison = ModelComparison([reg1, reg2], df, target_name, column_names)
+    leaderboard = comparison.leaderboard()
+    assert leaderboard["mse"].is_monotonic_increasing
+    assert np.isclose(comparison.metrics()["mse"].iloc[0],
+                      metrics.mean_squared_error(df[target_name], reg1.predict(df[column_names])))
+    losses = comparison.losses()
+    expected = stats.ttest_rel(losses[0], losses[1]).pvalue
+    p_values = comparison.pairwise_significance(correction=None)
+    assert np.isclose(p_values.iloc[0, 1], expected)
+
+def test_paired_bootstrap_grouped_matches_exact():
+    data_rng = np.random.RandomState(0)
+    y_true = data_rng.normal(size=50000)
+    y_pred_one = y_true + data_rng.standard_t(3, size=50000)
+    y_pred_two = y_true + data_rng.normal(size=50000)
+    exact = significance.paired_bootstrap_regression(y_true, y_pred_one, y_pred_two,
+                                                     n_resamples=1000, seed=0,
+                                                     method="exact")
+    grouped = significance.paired_bootstrap_regression(y_true, y_pred_one, y_pred_two,
+                                                       n_resamples=1000, seed=0,
+                                                       method="grouped", n_groups=256)
+    for metric in ["mse", "mae"]:
+        assert exact[metric]["difference"] == grouped[metric]["difference"]
+        width = np.diff(exact[metric]["confidence_interval"])[0]
+        assert np.allclose(exact[metric]["confidence_interval"],
+                           grouped[metric]["confidence_interval"], atol=0.15 * width)
+
+def test_significant_two_model_regression_testing():
+    df, column_names, target_name, reg1, reg2 = generate_regression_data_and_models()
+    test_suite = regression_tests.RegressionComparison(reg1, reg2, df,
+                                                       target_name, column_names)
+    results = test_suite.paired_bootstrap(n_resamples=500, seed=0)
+    assert results["mse"]["confidence_interval"][0] <= results["mse"]["difference"]
+    assert isinstance(test_suite.significant_two_model_regression_testing(seed=0), bool)
+
+class CountingRegressor(tree.DecisionTreeRegressor):
+    fit_calls = 0
+
+    def fit(self, X, y, sample_weight=None, check_input=True):
+        CountingRegressor.fit_calls += 1
+        return super().fit(X, y, sample_weight=sample_weight, check_input=check_input)
+
+def test_cv_checks_share_one_set_of_fold_fits():
+    df, column_names, target_name, _, _ = generate_regression_data_and_models()
+    reg = CountingRegressor(max_depth=4, random_state=0)
+    test_suite = regression_tests.RegressionTests(reg, df, target_name, column_names)
+    expected = model_selection.cross_validate(
+        reg, df[column_names], df[target_name], cv=3,
+        scoring={"mse": metrics.make_scorer(metrics.mean_squared_error),
+                 "mae": metrics.make_scorer(metrics.median_absolute_error)})
+    CountingRegressor.fit_calls = 0
+    assert np.allclose(test_suite.mse_cv(3), expected["test_mse"])
+    assert np.allclose(test_suite.mae_cv(3), expected["test_mae"])
+    test_suite.cross_val_mse_anomaly_detection(1000, cv=3)
+    test_suite.cross_val_mae_avg(0, cv=3)
+    test_suite.cross_val_mae_upper_boundary(1000, cv=3)
+    assert CountingRegressor.fit_calls == 3
+
+def test_residual_metrics_match_sklearn():
+    data_rng = np.random.RandomState(0)
+    y_true = data_rng.normal(size=500)
+    y_pred = y_true + data_rng.standard_t(3, size=500)
+    measures = regression_tests.residual_metrics(y_true, y_pred, quantiles=[0.1, 0.9])
+    assert np.isclose(measures["mse"], metrics.mean_squared_error(y_true, y_pred))
+    assert np.isclose(measures["mae"], metrics.mean_absolute_error(y_true, y_pred))
+    assert np.isclose(measures["median_ae"], metrics.median_absolute_error(y_true, y_pred))
+    for quantile in [0.1, 0.9]:
+        assert np.isclose(measures["pinball_{}".format(quantile)],
+                          metrics.mean_pinball_loss(y_true, y_pred, alpha=quantile))
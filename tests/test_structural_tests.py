@@ -1,5 +1,8 @@
 from drifter_ml import structural_tests
 import numpy as np
+from sklearn import metrics
+from sklearn import cluster
+from sklearn import neighbors
 import pandas as pd
 
 def generate_classification_data_and_models():
@@ -304,3 +307,121 @@ def test_reg_supervised_similar_clustering():
     except:
         assert False
 
+
+def test_unsupervised_kmeans_fits_each_k_once(tmpdir):
+    new_data, historical_data = generate_unsupervised_data()
+    columns = ["similar_normal", "similar_gamma"]
+    test_suite = structural_tests.StructuralData(new_data,
+                                                 historical_data,
+                                                 columns,
+                                                 '')
+    test_suite.unsupervised_kmeans_score_clustering(-1)
+    assert len(test_suite.kmeans_cache) == 20
+    cached = dict(test_suite.kmeans_cache)
+    test_suite.unsupervised_kmeans_score_clustering(-1)
+    assert all(test_suite.kmeans_cache[key] is cached[key] for key in cached)
+
+    path = str(tmpdir.join("historical_kmeans.joblib"))
+    test_suite.save_historical_kmeans(path)
+    reloaded = structural_tests.StructuralData(new_data,
+                                               historical_data,
+                                               columns,
+                                               '')
+    reloaded.load_historical_kmeans(path)
+    assert len(reloaded.kmeans_cache) == 10
+    assert (reloaded.cached_kmeans_clusters("historical", 3) ==
+            test_suite.cached_kmeans_clusters("historical", 3)).all()
+
+def test_scalable_kmeans_scorer():
+    new_data, historical_data = generate_unsupervised_data()
+    new_data["target"] = (new_data["similar_normal"] > 0).astype(int)
+    historical_data["target"] = (historical_data["similar_normal"] > 0).astype(int)
+    test_suite = structural_tests.StructuralData(new_data,
+                                                 historical_data,
+                                                 ["similar_normal", "similar_gamma"],
+                                                 "target")
+    result = test_suite.scalable_kmeans_scorer(metrics.v_measure_score, -1,
+                                               sample_budget=200,
+                                               random_state=0)
+    assert result["similar"]
+    assert -1 <= result["confidence"] <= 1
+    approximation = test_suite.fit_scalable_kmeans("new", 3, sample_budget=200,
+                                                   random_state=0)
+    assert approximation.sample_size <= 201
+    assert len(approximation.labels_) == len(new_data)
+
+def test_scalable_kmeans_scorer_with_different_lengths():
+    rng = np.random.RandomState(0)
+    new_data = pd.DataFrame({"A": rng.normal(0, 1, size=1000),
+                             "B": rng.normal(0, 1, size=1000)})
+    historical_data = pd.DataFrame({"A": rng.normal(0, 1, size=3000),
+                                    "B": rng.normal(0, 1, size=3000)})
+    test_suite = structural_tests.StructuralData(new_data,
+                                                 historical_data,
+                                                 ["A", "B"],
+                                                 "target")
+    result = test_suite.scalable_kmeans_scorer(metrics.adjusted_rand_score, -1,
+                                               sample_budget=500, random_state=0,
+                                               max_total_variation=0.2)
+    assert result["similar"]
+    shifted = structural_tests.StructuralData(new_data + [3, 0],
+                                              historical_data,
+                                              ["A", "B"],
+                                              "target")
+    result = shifted.scalable_kmeans_scorer(metrics.adjusted_rand_score, -1,
+                                            sample_budget=500, random_state=0,
+                                            max_total_variation=0.2)
+    assert not result["similar"]
+
+def test_dbscan_sweep_reuses_one_neighborhood_graph():
+    new_data, historical_data = generate_unsupervised_data()
+    new_data["target"] = (new_data["similar_normal"] > 0).astype(int)
+    historical_data["target"] = (historical_data["similar_normal"] > 0).astype(int)
+    columns = ["similar_normal", "similar_gamma"]
+    test_suite = structural_tests.StructuralData(new_data,
+                                                 historical_data,
+                                                 columns,
+                                                 "target")
+    assert test_suite.unsupervised_dbscan_score_clustering(
+        -1, eps_values=[0.3, 0.5, 1.0], min_samples_values=[3, 5])
+    graphs = [key for key in test_suite.dbscan_cache if key[0] == "graph"]
+    assert sorted(graphs) == [("graph", "historical", 1.0), ("graph", "new", 1.0)]
+    for eps, min_samples in [(0.3, 3), (0.5, 5), (1.0, 5)]:
+        expected = cluster.DBSCAN(eps=eps, min_samples=min_samples).fit_predict(
+            new_data[columns])
+        assert (test_suite.fit_dbscan("new", eps, min_samples) == expected).all()
+
+def test_occupancy_drift_handles_batches_of_any_size():
+    rng = np.random.RandomState(0)
+    historical_data = pd.DataFrame({"x": rng.normal(0, 1, 2000),
+                                    "y": rng.normal(0, 1, 2000)})
+    small_batch = pd.DataFrame({"x": rng.normal(0, 1, 137),
+                                "y": rng.normal(0, 1, 137)})
+    shifted_batch = pd.DataFrame({"x": rng.normal(3, 1, 500),
+                                  "y": rng.normal(0, 1, 500)})
+    same = structural_tests.StructuralData(small_batch, historical_data,
+                                           ["x", "y"], "")
+    shifted = structural_tests.StructuralData(shifted_batch, historical_data,
+                                              ["x", "y"], "")
+    drift = same.kmeans_occupancy_drift(4, pvalue_threshold=0.001)
+    assert drift["similar"]
+    assert len(same.assign_kmeans(4)) == len(small_batch)
+    assert not shifted.kmeans_occupancy_drift(4)["similar"]
+    assert same.dbscan_occupancy_drift(eps=0.3, min_samples=5,
+                                       max_total_variation=0.25)["similar"]
+    assert not shifted.dbscan_occupancy_drift(eps=0.3, min_samples=5)["similar"]
+    assert len(shifted.assign_dbscan(eps=0.3, min_samples=5)) == len(shifted_batch)
+
+def test_knn_k_sweep_matches_refitting_each_k():
+    rng = np.random.RandomState(1)
+    data = pd.DataFrame({"a": rng.normal(size=400), "b": rng.normal(size=400)})
+    data["target"] = (data["a"] + rng.normal(size=400) > 0).astype(int) + (data["b"] > 1)
+    test_suite = structural_tests.StructuralData(data, data, ["a", "b"], "target")
+    k_measures = []
+    for k in range(2, 12):
+        knn = neighbors.KNeighborsClassifier(n_neighbors=k)
+        knn.fit(data[["a", "b"]], data["target"])
+        y_pred = knn.predict(data[["a", "b"]])
+        k_measures.append((k, metrics.mean_squared_error(data["target"], y_pred)))
+    best_k = sorted(k_measures, key=lambda t: t[1])[0][0]
+    assert test_suite.cls_supervised_clustering(data) == best_k
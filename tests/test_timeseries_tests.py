@@ -0,0 +1,95 @@
+import os
+from drifter_ml import timeseries_tests
+from drifter_ml.timeseries_tests import change_point
+import numpy as np
+import pandas as pd
+import pytest
+
+def generate_timeseries_data():
+    rng = np.random.RandomState(0)
+    n = 20000
+    timestamps = pd.Timestamp("2019-01-01") + pd.to_timedelta(
+        rng.randint(0, 14 * 24 * 60, size=n), unit="min")
+    values = rng.normal(0, 1, size=n)
+    # the last day drifts
+    values[timestamps >= pd.Timestamp("2019-01-14")] += 3
+    return pd.DataFrame({"timestamp": timestamps, "value": values})
+
+def test_sliding_drift_matches_recomputing_each_window():
+    data = generate_timeseries_data()
+    test_suite = timeseries_tests.TimeSeriesData(data, "timestamp", ["value"], bucket="1h")
+    result = test_suite.sliding_drift("value", window="6h", reference="2D", step="3h")
+    assert len(result) > 50
+    for window_end, row in result.iloc[::7].iterrows():
+        start = window_end - pd.Timedelta("6h")
+        current = test_suite.window_rows(start, window_end)["value"]
+        reference = test_suite.window_rows(start - pd.Timedelta("2D"), start)["value"]
+        assert row["count"] == len(current)
+        assert row["reference_count"] == len(reference)
+        assert np.isclose(row["mean"], current.mean())
+        assert np.isclose(row["reference_std"], reference.std(ddof=0))
+
+def test_tumbling_drift_flags_the_drifted_day():
+    data = generate_timeseries_data()
+    test_suite = timeseries_tests.TimeSeriesData(data, "timestamp", ["value"], bucket="1h")
+    result = test_suite.tumbling_drift("value", window="1D", reference="7D")
+    drifted = result.index > pd.Timestamp("2019-01-14")
+    assert drifted.sum() == 1
+    assert not result.loc[drifted, "distribution_similar"].any()
+    assert not result.loc[drifted, "mean_similar"].any()
+    assert result.loc[~drifted, "distribution_similar"].all()
+
+def test_integer_timestamps_need_an_explicit_bucket():
+    data = generate_timeseries_data()
+    data["timestamp"] = (data["timestamp"] - pd.Timestamp("2019-01-01")) // pd.Timedelta("1min")
+    with pytest.raises(ValueError):
+        timeseries_tests.TimeSeriesData(data, "timestamp", ["value"])
+    with pytest.raises(ValueError):
+        timeseries_tests.TimeSeriesData(data, "timestamp", ["value"], bucket="1h")
+    test_suite = timeseries_tests.TimeSeriesData(data, "timestamp", ["value"], bucket=60)
+    result = test_suite.tumbling_drift("value", window=24 * 60, reference=7 * 24 * 60)
+    drifted = result.index > 13 * 24 * 60
+    assert drifted.sum() == 1
+    assert not result.loc[drifted, "mean_similar"].any()
+    assert result.loc[~drifted, "distribution_similar"].all()
+
+def generate_stream():
+    rng = np.random.RandomState(1)
+    values = rng.normal(0, 1, size=30000)
+    values[10000:] += 1
+    values[20000:] -= 3
+    return values
+
+def test_change_point_batches_match_single_updates():
+    values = generate_stream()
+    for detector_class in change_point.DETECTORS.values():
+        batched = detector_class()
+        batched.min_chunk_size = 100
+        batched.chunk_size = 777
+        single = detector_class()
+        detections = batched.update_batch(values)
+        flags = [single.update(value) for value in values]
+        assert np.array_equal(detections, np.flatnonzero(flags))
+        assert batched.n_detections == single.n_detections == len(detections)
+
+def test_change_point_detectors_flag_the_shifts():
+    values = generate_stream()
+    detectors = [change_point.CUSUM(mean=0, std=1, h=20),
+                 change_point.PageHinkley(),
+                 change_point.ADWIN()]
+    for detector in detectors:
+        detections = detector.update_batch(values)
+        assert ((detections >= 10000) & (detections < 10500)).any()
+        assert ((detections >= 20000) & (detections < 20500)).any()
+
+def test_benchmark_detectors():
+    throughput = change_point.benchmark_detectors(n_events=100000, batch_size=10000,
+                                                  seed=0)
+    assert sorted(throughput) == ["adwin", "cusum", "page_hinkley"]
+    assert all(events_per_second > 0 for events_per_second in throughput.values())
+
+@pytest.mark.skipif(not os.environ.get("DRIFTER_ML_BENCHMARKS"),
+                    reason="timing benchmark, set DRIFTER_ML_BENCHMARKS=1 to run")
+def test_detectors_process_a_million_events_per_second():
+    throughput = change_point.benchmark_detectors(n_events=1000000, seed=0)
+    assert all(events_per_second > 1e6 for events_per_second in throughput.values())